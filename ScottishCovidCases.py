@@ -3,21 +3,144 @@
 # Data is taken from - https://www.gov.scot/publications/coronavirus-covid-19-trends-in-daily-data/
 
 # Imports
-from bs4 import BeautifulSoup as bs
-import requests
+# Only modules that are quick to import are imported here. The rest (bs4, requests, openpyxl, send2trash, numpy, ...)
+# are imported by the functions that use them, so arguments such as -h and -hb start without loading them
 from datetime import date
-import urllib.request
-from openpyxl import *
 import os
 import sys
-import shutil
-from send2trash import send2trash
 import argparse
 import re
-import platform
+import json
+import struct
+import itertools
+import zlib
+import functools
+from array import array
+import threading
+import time
+import contextlib
+import importlib
+import collections
+import tracemalloc
+
+
+# Binary cache of the cumulative cases sheet, stored next to the Excel file it was built from
+CACHE_EXT = '.cache'  # Added to the Excel file name to give the name of its cache file
+CACHE_MAGIC = b'SCCCACHE'  # Identifies a file as a cache written by this program
+CACHE_VERSION = 4  # Increase when the cache layout changes, so older caches get rebuilt
+MISSING = -1  # Stored in the cache for suppressed ('*') or empty cells
+INGEST_PARTS = ('xl/sharedStrings.xml', 'xl/styles.xml')  # Parts of an Excel file that give the meaning of its cells
+XML_CHUNK = 1048576  # The number of bytes of a sheet's XML read at a time, when finding or leaving out its earlier rows
+
+
+# The health board names that can be given as arguments
+healthBoards = ['Ayrshire Arran', 'Borders', 'Dumfries Galloway', 'Fife', 'Forth Valley', 'Grampian', 'Greater Glasgow Clyde', 'Highland', 'Lanarkshire', 'Lothian', 'Orkney', 'Shetland', 'Tayside', 'Western Isles', 'Scotland']
+# The error shown when a health board name does not match any of the health boards
+invalidNameMessage = 'Error - Invalid name given, please enter a name that matches one of the following:\n' + \
+                     str(healthBoards) + '\nEnding program'
+# Other names for the health boards, and the simplified health board name (see getNameKey()) they are for
+HEALTH_BOARD_ALIASES = {'glasgow': 'greater glasgow clyde', 'gg c': 'greater glasgow clyde',
+                        'a a': 'ayrshire arran', 'ayrshire': 'ayrshire arran', 'arran': 'ayrshire arran',
+                        'd g': 'dumfries galloway', 'eilean siar': 'western isles', 'na h eileanan siar': 'western isles',
+                        'comhairle nan eilean siar': 'western isles', 'outer hebrides': 'western isles',
+                        'edinburgh': 'lothian', 'aberdeen': 'grampian', 'dundee': 'tayside', 'inverness': 'highland',
+                        'stirling': 'forth valley', 'falkirk': 'forth valley', 'lanark': 'lanarkshire'}
+# The website that hosts the files
+PAGE_URL = 'https://www.gov.scot/publications/coronavirus-covid-19-trends-in-daily-data/'
+FETCH_METADATA = 'fetch.json'  # Stores the details of the last website check in the ExcelFiles directory
+MANIFEST = 'manifest.json'  # Lists the Excel files in the ExcelFiles directory, and which one is the newest
+LOCK_FILE = '.lock'  # Locked while a run changes the files in a directory, so other runs wait for it to finish
+DOWNLOAD_LOCK_FILE = '.download.lock'  # Locked while a run checks the website and downloads, so only one run does
+ROLLING_WINDOWS = (7, 14, 28)  # The numbers of days that -ra can average the daily cases over
+SNAPSHOT_DIR = 'Snapshots'  # Stores the snapshots of older covid data, in the ExcelFiles directory
+SNAPSHOT_KEYFRAME = 30  # Every 30th snapshot stores all of its rows, instead of the rows changed since the last one
+RELOAD_INTERVAL = 600  # How often, in seconds, the server checks for newer data
+TIMINGS_KEPT = 1000  # The number of recent step timings kept, for --timings, --trace and the server's /timings
+DOWNLOAD_ATTEMPTS = 5  # The number of times a download is tried before giving up
+DOWNLOAD_BACKOFF = 1  # The seconds to wait before the first retry, doubled after each failed attempt
+DOWNLOAD_TIMEOUT = 60  # The seconds to wait for the website to respond, before retrying
+DOWNLOAD_CHUNK = 65536  # The number of bytes read from the website at a time
+DOWNLOAD_CONNECTIONS = 4  # The most files downloaded at the same time
+PARTIAL_EXT = '.part'  # Added to the name of a file while it is being downloaded
+PARTIAL_DETAILS_EXT = '.json'  # Added to the name of a partial download, for the details of the file being downloaded
+# The export format used for each file extension, when --format is not given
+EXPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.parquet': 'parquet', '.arrow': 'arrow'}
+EXPORT_BATCH_ROWS = 10000  # The number of rows converted and written at a time, and the Parquet row group size
+
+
+class QueryError(Exception):
+    """
+    Raised when a query can not be answered, e.g. an invalid health board name or number of days
+    The message is shown to the user in place of the query results
+    """
+
+
+class RowsChangedError(Exception):
+    """
+    Raised when the earlier rows of a sheet are not the same as when the cache of an earlier file was built, so the
+    sheet has to be read in full
+    """
+
+
+class DownloadError(Exception):
+    """
+    Raised when a downloaded file is not what was expected, e.g. it is smaller than its size or is not an Excel file
+    The file is downloaded again from the start
+    """
 
 
 # Functions
+@contextlib.contextmanager
+def phaseTimer(name):
+    """
+    Records how long a step of the program takes, for --timings, --trace and the server's /timings
+    The peak memory is only recorded when tracemalloc is running, which --memory starts
+    :param name: (str): The name of the step, e.g. downloadData
+    :return: (dict): The record of the step, the step can add the number of bytes it transferred as 'bytes'
+    """
+    record = {'phase': name, 'bytes': 0}
+    tracing = tracemalloc.is_tracing()
+    if tracing and hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()  # Only available from Python 3.9, before that the peak is for the whole run
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['milliseconds'] = round((time.perf_counter() - start) * 1000, 3)
+        record['peakMemory'] = tracemalloc.get_traced_memory()[1] if tracing else None
+        with timingsLock:
+            phaseTimings.append(record)
+            totals = phaseTotals.setdefault(name, {'count': 0, 'milliseconds': 0, 'bytes': 0, 'peakMemory': None})
+            totals['count'] += 1
+            totals['milliseconds'] = round(totals['milliseconds'] + record['milliseconds'], 3)
+            totals['bytes'] += record['bytes']
+            if record['peakMemory'] is not None:
+                totals['peakMemory'] = max(totals['peakMemory'] or 0, record['peakMemory'])
+
+
+def getTimings():
+    """
+    Gets the recorded timings of each step of the program
+    :return: (dict): The totals for each step ('totals') and the most recent TIMINGS_KEPT steps in order ('phases')
+    """
+    with timingsLock:
+        return {'totals': json.loads(json.dumps(phaseTotals)), 'phases': list(phaseTimings)}
+
+
+def outputTimings():
+    """
+    Outputs the recorded timings of each step of the program in a table, to stderr so it does not mix with the results
+    """
+    rows = [['Phase', 'Time (ms)', 'Bytes', 'Peak memory (bytes)']]
+    for record in getTimings()['phases']:
+        peakMemory = '-' if record['peakMemory'] is None else str(record['peakMemory'])
+        rows.append([record['phase'], '%.3f' % record['milliseconds'], str(record['bytes']), peakMemory])
+    widths = [max(len(row[col]) for row in rows) for col in range(4)]
+    print(file=sys.stderr)
+    for row in rows:
+        print(' | '.join(row[col].ljust(widths[col]) for col in range(4)), file=sys.stderr)
+
+
 def getFormattedDate(formatted=True):
     """
     Returns the date in a specified format, depending on parameters
@@ -39,44 +162,229 @@ def getFormattedDate(formatted=True):
     return dateStr
 
 
-def downloadData(url, file):
+def readPartialDetails(partialPath):
+    """
+    Reads the details saved when a partial download was started, so it is only carried on from the same file
+    :param partialPath: (str): The path of the partial download
+    :return: (dict): The URL, ETag, Last-Modified date and size of the file being downloaded, or None if there are none
+    """
+    try:
+        with open(partialPath + PARTIAL_DETAILS_EXT) as detailsFile:
+            return json.load(detailsFile)
+    except (OSError, ValueError):
+        return None
+
+
+def removePartial(partialPath):
+    """
+    Removes a partial download and its details, so the next attempt starts from the beginning
+    :param partialPath: (str): The path of the partial download
+    """
+    for oldPath in (partialPath, partialPath + PARTIAL_DETAILS_EXT):
+        if os.path.exists(oldPath):
+            os.remove(oldPath)
+
+
+def getValidator(headers):
+    """
+    Gets the value that identifies the version of a file on the website, from the headers of a response
+    :param headers: (email.message.Message or dict): The response headers, or the details from readPartialDetails()
+    :return: (str): The ETag, or the Last-Modified date if there is no strong ETag, or None if there is neither
+    """
+    etag = headers.get('ETag') or headers.get('etag')
+    if etag and not etag.startswith('W/'):  # Weak ETags can not be used to carry on a download
+        return etag
+    return headers.get('Last-Modified') or headers.get('lastModified')
+
+
+def fetchFile(url, path, size=None, sha256=None):
+    """
+    Downloads a file, carrying on from the end of any earlier partial download of it
+    The file is written to path + PARTIAL_EXT and only renamed to path once it is complete and checked, so a
+    download that is stopped part way never leaves a broken file in its place. The ETag or Last-Modified date of the
+    file is saved next to the partial download and sent back with If-Range, so a download is only carried on if the
+    file on the website has not changed, otherwise it starts again.
+    :param url: (str): The URL of the file
+    :param path: (str): Where to save the file
+    :param size: (int): The expected size of the file in bytes, or None if it is not known
+    :param sha256: (str): The expected SHA-256 hash of the file, or None if it is not known
+    :return: (dict): The number of bytes downloaded, the size of the file and its SHA-256 hash
+    """
+    import hashlib
+    import urllib.error
+    import urllib.request
+    import zipfile
+
+    partialPath = path + PARTIAL_EXT
+    details = readPartialDetails(partialPath)
+    offset = os.path.getsize(partialPath) if os.path.exists(partialPath) else 0
+    if offset > 0 and (details is None or details.get('url') != url or getValidator(details) is None):
+        removePartial(partialPath)  # There is no way to tell if the file has changed, so start again
+        offset = 0
+    request = urllib.request.Request(url)
+    if offset > 0:
+        request.add_header('Range', 'bytes=' + str(offset) + '-')  # Asks for the rest of the file
+        request.add_header('If-Range', getValidator(details))  # Only if it is still the same file
+    try:
+        response = urllib.request.urlopen(request, timeout=DOWNLOAD_TIMEOUT)
+    except urllib.error.HTTPError as error:
+        if error.code != 416 or offset == 0:
+            raise
+        # The partial download may already be the whole file, which is only trusted if it is the size it was meant
+        # to be and the website gives the same size, as the website would have sent the file if it had changed
+        total = error.headers.get('Content-Range', '').rpartition('/')[2]
+        if details.get('size') != offset or total != str(offset):
+            removePartial(partialPath)
+            raise DownloadError('the partial download does not match the file on the website')
+        response = None
+
+    fileHash = hashlib.sha256()
+    downloaded = 0
+    if response is None:
+        total = offset
+        with open(partialPath, 'rb') as partialFile:
+            for chunk in iter(lambda: partialFile.read(DOWNLOAD_CHUNK), b''):
+                fileHash.update(chunk)
+    else:
+        with response:
+            contentRange = response.headers.get('Content-Range', '')
+            if offset > 0 and response.status == 206:
+                total = contentRange.rpartition('/')[2]
+                # The rest of the file has to start where the partial download ends, and be from the same file
+                if not contentRange.startswith('bytes ' + str(offset) + '-') or \
+                        getValidator(response.headers) not in (None, getValidator(details)) or \
+                        (details.get('size') is not None and total != str(details['size'])):
+                    removePartial(partialPath)
+                    raise DownloadError('the file on the website changed part way through the download')
+            else:
+                offset = 0  # The website is sending the whole file, e.g. it has changed, so start again
+                total = response.headers.get('Content-Length')
+            total = int(total) if total and total.isdigit() else None
+            if offset == 0:
+                # Saves which version of the file is being downloaded, so an interrupted download can be carried on
+                with open(partialPath + PARTIAL_DETAILS_EXT, 'w') as detailsFile:
+                    json.dump({'url': url, 'etag': response.headers.get('ETag'), 'size': total,
+                               'lastModified': response.headers.get('Last-Modified')}, detailsFile)
+            with open(partialPath, 'r+b' if offset > 0 else 'w+b') as partialFile:
+                # The hash of the file covers the part already downloaded, then the rest is added to the end
+                for chunk in iter(lambda: partialFile.read(DOWNLOAD_CHUNK), b''):
+                    fileHash.update(chunk)
+                for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK), b''):
+                    partialFile.write(chunk)
+                    fileHash.update(chunk)
+                    downloaded += len(chunk)
+
+    # Checks the file is complete and is the file that was expected, before putting it in place
+    fileSize = os.path.getsize(partialPath)
+    if total is not None and fileSize < total:
+        raise ConnectionError('the download stopped after ' + str(fileSize) + ' of ' + str(total) + ' bytes')
+    try:
+        if (total is not None and fileSize != total) or (size is not None and fileSize != size):
+            raise DownloadError('the file is ' + str(fileSize) + ' bytes, not ' + str(size or total))
+        if sha256 is not None and fileHash.hexdigest() != sha256:
+            raise DownloadError('the file does not match its SHA-256 hash')
+        if path.endswith('.xlsx'):
+            # Checks every file in the zip file against its CRC, which finds a file joined together from two versions
+            try:
+                with zipfile.ZipFile(partialPath) as excel:
+                    if excel.testzip() is not None:
+                        raise DownloadError('the Excel file is damaged')
+            except (zipfile.BadZipFile, zlib.error, EOFError):
+                raise DownloadError('the file is not an Excel file')
+    except DownloadError:
+        removePartial(partialPath)  # Starts the next attempt from the beginning
+        raise
+    os.replace(partialPath, path)
+    removePartial(partialPath)  # Removes the details of the partial download
+    return {'bytes': downloaded, 'size': fileSize, 'sha256': fileHash.hexdigest()}
+
+
+async def fetchFileWithRetries(url, path, size=None, sha256=None, connections=None):
+    """
+    Downloads a file, trying again after a growing wait if the download fails
+    An interrupted download carries on from where it stopped, using the partial file saved by fetchFile()
+    :param url: (str): The URL of the file
+    :param path: (str): Where to save the file
+    :param size: (int): The expected size of the file in bytes, or None if it is not known
+    :param sha256: (str): The expected SHA-256 hash of the file, or None if it is not known
+    :param connections: (asyncio.Semaphore): Limits the number of files downloaded at once, or None for no limit
+    :return: (dict): The details of the download, as returned by fetchFile()
+    """
+    import asyncio
+    import http.client
+    import urllib.error
+
+    loop = asyncio.get_running_loop()
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        try:
+            async with connections or contextlib.AsyncExitStack():
+                # urllib blocks while it waits for the website, so each download runs in its own thread
+                return await loop.run_in_executor(None, fetchFile, url, path, size, sha256)
+        except urllib.error.HTTPError as error:
+            # The file is missing or the request is wrong, so trying again will not help
+            if 400 <= error.code < 500 and error.code not in (408, 429):
+                raise
+            lastError = error
+        # Includes connection errors, timeouts and the connection closing part way through the file
+        except (OSError, http.client.HTTPException, DownloadError) as error:
+            lastError = error
+        if attempt + 1 < DOWNLOAD_ATTEMPTS:
+            print('Error! Downloading ' + url + ' failed (' + str(lastError) + '), trying again', file=statusOutput)
+            await asyncio.sleep(DOWNLOAD_BACKOFF * 2 ** attempt)
+    raise lastError
+
+
+async def fetchFiles(downloads):
+    """
+    Downloads several files at the same time, with up to DOWNLOAD_CONNECTIONS downloads running at once
+    :param downloads: (list): The files to download, each a tuple of its URL, where to save it, and its expected size
+                              and SHA-256 hash, which can be None if they are not known
+    :return: (list): The details of each download, as returned by fetchFile(), or the error that stopped it
+    """
+    import asyncio
+
+    connections = asyncio.Semaphore(DOWNLOAD_CONNECTIONS)
+    return await asyncio.gather(*[fetchFileWithRetries(url, path, size, sha256, connections)
+                                  for url, path, size, sha256 in downloads], return_exceptions=True)
+
+
+def downloadData(url, file, size=None, sha256=None):
     """
-    Downloads the latest excel file of Scottish Covid cases from the given URL
+    Downloads the latest excel file of Scottish Covid cases from the given URL, into the ExcelFiles directory
     :param url: (str): The URL of the Scottish Gov Covid Cases website
     :param file: (str; The name of the file to check for
+    :param size: (int): The expected size of the file in bytes, e.g. from an earlier download of it, or None
+    :param sha256: (str): The expected SHA-256 hash of the file, e.g. from an earlier download of it, or None
+    :return: (dict): The details of the download, as returned by fetchFile(), or None if the file already exists
     """
+    import asyncio
+
     # Check if a file with that name already exists, if not, download a fresh copy
-    # Uses the os module to check the name of the file to download, against all the files in the ExcelFiles directory
-    if platform.system() == "Windows":
-        dir = r"\\ExcelFiles\\"
-    else:
-        dir = '/ExcelFiles/'
-    if file in os.listdir(os.getcwd() + dir):
-        print('A file with today\'s date already exists, using that.')
-    else:
-        try:
-            # Attempts to use the urllib module to download the given file from the Scot Gov website
-            urllib.request.urlretrieve(url, file)  # Downloads to the same directory as the python file
-        # If there is an issue with the given URL, display an error, the given URL and end the program
-        except urllib.error.URLError:
-            print("Error! The given URL is incorrect, please check the URL")
-            print("URL Given: " + url)
-            print('Ending program as no data available to analyse')
-            sys.exit()  # Ends the program as the URL failed, so no data available
-        print("Local data matches most recently available data")
-        # Move the newly downloaded file into the correct directory
-        shutil.move(newestFile, 'ExcelFiles')
+    path = os.path.join('ExcelFiles', file)
+    if os.path.exists(path):
+        print('A file with today\'s date already exists, using that.', file=statusOutput)
+        return None
+    result = asyncio.run(fetchFiles([(url, path, size, sha256)]))[0]
+    # If the file could not be downloaded, display an error, the given URL and end the program
+    if isinstance(result, Exception):
+        print("Error! The file could not be downloaded, please check the URL: " + str(result), file=statusOutput)
+        print("URL Given: " + url, file=statusOutput)
+        print('Ending program as no data available to analyse', file=statusOutput)
+        sys.exit()  # Ends the program as the URL failed, so no data available
+    print("Local data matches most recently available data", file=statusOutput)
+    return result
 
 
-def getURLs():
+def getURLs(page):
     """
     Scans a web page for all URLs
+    :param page: (str): The HTML content of the Scottish Gov Covid page
     :return: (list); A list of all of the URLS from the Scottish Gov Covid page
     """
-    # The website that hosts the files
-    url = 'https://www.gov.scot/publications/coronavirus-covid-19-trends-in-daily-data/'
+    from bs4 import BeautifulSoup as bs
+
     # Create a soup object, that reads the HTML content and create a list to later store the results
-    soup = bs(requests.get(url).text, 'html.parser')
+    soup = bs(page, 'html.parser')
     links = []
 
     # Loop through all of the content in the soup object, adding each hyperlink to the list and return the list
@@ -86,12 +394,12 @@ def getURLs():
     return links
 
 
-def formatFileName():
+def formatFileName(links):
     """
     Gets the name of the covid data sheet and formats it to rename the exhcel sheet when its downloaded
+    :param links: (list): A list of URLs to search through for the Excel file
     :return: (str): A String to name the downloaded excel sheet of covid data
     """
-    links = getURLs()  # Get a list of URLs to search through for the Excel file
     fileName = ''  # The intended filename for the download object
 
     try:
@@ -114,8 +422,1099 @@ def formatFileName():
     except:
         # Print warning message to user
         print('Error! Found no file to download. Please check the URL has a valid file to download.\nIt is possible '
-              'the file name has changed.')
+              'the file name has changed.', file=statusOutput)
+        sys.exit()
+
+
+def readFetchMetadata():
+    """
+    Reads the details saved from the last time the website was checked
+    :return: (dict): The ETag, Last-Modified date and hash of the page, and the name of the newest file found on it
+    """
+    try:
+        with open(os.path.join('ExcelFiles', FETCH_METADATA)) as metadataFile:
+            return json.load(metadataFile)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveFetchMetadata(metadata):
+    """
+    Saves the details of the website check, so the next check can ask the website if the page has changed
+    :param metadata: (dict): The details to save, as returned by readFetchMetadata()
+    """
+    path = os.path.join('ExcelFiles', FETCH_METADATA)
+    with open(path + '.tmp', 'w') as metadataFile:
+        json.dump(metadata, metadataFile)
+    os.replace(path + '.tmp', path)
+
+
+@contextlib.contextmanager
+def lockDirectory(directory, shared=False, lockName=LOCK_FILE):
+    """
+    Locks a directory, so runs of the program in other processes do not change its files at the same time
+    Any number of runs can hold a shared lock to read the files, while only one can hold the lock to change them
+    The lock is released when the with block ends, or if the process ends
+    :param directory: (str): The directory to lock
+    :param shared: (bool): True to only read the files, False to change them
+    :param lockName: (str): The name of the lock file, LOCK_FILE for the files, or DOWNLOAD_LOCK_FILE for downloading
+    """
+    try:
+        lockFile = open(os.path.join(directory, lockName), 'a+b')
+    except OSError:
+        yield  # The directory can not be written to, so no other run can change its files either
+        return
+    try:
+        if not acquireLock(lockFile, shared, False):
+            print('Waiting for another run to finish updating the covid data...', file=sys.stderr)
+            acquireLock(lockFile, shared, True)
+        yield
+    finally:
+        lockFile.close()  # Closing the file releases the lock
+
+
+def acquireLock(lockFile, shared, wait):
+    """
+    Locks an open lock file, using fcntl on Linux and macOS, or msvcrt on Windows
+    :param lockFile: (file): The open lock file
+    :param shared: (bool): True for a shared lock, Windows only has exclusive locks so always uses one of those
+    :param wait: (bool): True to wait until the lock is free, False to give up straight away
+    :return: (bool): True if the file was locked, False if another process holds the lock
+    """
+    if os.name == 'nt':
+        import msvcrt
+        while True:
+            try:
+                lockFile.seek(0)
+                msvcrt.locking(lockFile.fileno(), msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not wait:
+                    return False
+                time.sleep(0.1)  # msvcrt can only wait for 10 seconds, so keep trying until the lock is free
+    import fcntl
+    try:
+        fcntl.flock(lockFile.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if wait else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+def readManifest():
+    """
+    Reads the list of Excel files in the ExcelFiles directory, which is used instead of listing the directory
+    :return: (dict): The name of the newest Excel file, the name of the file that was the newest before it, which is
+                     kept for runs that are still loading it, and the size and SHA-256 hash of each Excel file
+    """
+    try:
+        with open(os.path.join('ExcelFiles', MANIFEST)) as manifestFile:
+            return json.load(manifestFile)
+    except (OSError, ValueError):
+        pass
+    # There is no manifest yet, e.g. the first run after updating, so it is made from the files already downloaded
+    files = {}
+    if os.path.isdir('ExcelFiles'):
+        for theFile in sorted(os.listdir('ExcelFiles')):
+            if theFile.endswith('.xlsx'):
+                files[theFile] = {'size': os.path.getsize(os.path.join('ExcelFiles', theFile)), 'sha256': None}
+    newestFile = readFetchMetadata().get('newestFile')
+    return {'newestFile': newestFile if newestFile in files else None, 'previousFile': None, 'files': files}
+
+
+def saveManifest(manifest):
+    """
+    Saves the list of Excel files, replacing the old list in one step so other runs never read a half written list
+    :param manifest: (dict): The list of Excel files, as returned by readManifest()
+    """
+    path = os.path.join('ExcelFiles', MANIFEST)
+    with open(path + '.tmp', 'w') as manifestFile:
+        json.dump(manifest, manifestFile)
+    os.replace(path + '.tmp', path)
+
+
+def getNewestFileName():
+    """
+    Checks the website for the name of the newest covid data file
+    Sends the page's ETag and Last-Modified date from the last check, so the page is only read again if it has changed
+    :return: (str): A String to name the downloaded excel sheet of covid data
+    """
+    import hashlib
+    import requests
+
+    metadata = readFetchMetadata()
+    headers = {}
+    if metadata.get('etag'):
+        headers['If-None-Match'] = metadata['etag']
+    if metadata.get('lastModified'):
+        headers['If-Modified-Since'] = metadata['lastModified']
+
+    try:
+        with phaseTimer('fetchPage') as phase:
+            response = requests.get(PAGE_URL, headers=headers, timeout=30)
+            phase['bytes'] = len(response.content)
+    except requests.exceptions.RequestException:
+        if metadata.get('newestFile'):
+            print('Error! Could not reach the website, using the last known data.', file=statusOutput)
+            return metadata['newestFile']
+        raise
+
+    # The page has not changed since the last check (304 Not Modified), or its content is the same as last time
+    pageHash = hashlib.sha256(response.content).hexdigest()
+    if metadata.get('newestFile') and (response.status_code == 304 or pageHash == metadata.get('pageHash')):
+        return metadata['newestFile']
+
+    with phaseTimer('getURLs'):
+        links = getURLs(response.text)
+    with phaseTimer('formatFileName'):
+        newestFile = formatFileName(links)
+    saveFetchMetadata({'etag': response.headers.get('ETag'), 'lastModified': response.headers.get('Last-Modified'),
+                       'pageHash': pageHash, 'newestFile': newestFile})
+    return newestFile
+
+
+def getOfflineFileName():
+    """
+    Gets the name of the newest covid data file that has already been downloaded, without using the website
+    :return: (str): The name of the Excel file in the ExcelFiles directory
+    """
+    manifest = readManifest()
+    newestFile = manifest['newestFile']
+    if newestFile is not None and os.path.exists(os.path.join('ExcelFiles', newestFile)):
+        return newestFile
+    # Otherwise, use the most recently published Excel file
+    excelFiles = [theFile for theFile in manifest['files'] if os.path.exists(os.path.join('ExcelFiles', theFile))]
+    if len(excelFiles) == 0:
+        print('Error! There is no downloaded covid data to use offline.\nEnding program', file=statusOutput)
         sys.exit()
+    return max(excelFiles, key=lambda theFile: getPublishDate(theFile) or date.min)
+
+
+def getCachePath(path):
+    """
+    Gets the path of the binary cache file for the given Excel file, which is stored next to the Excel file
+    :param path: (str): The path of the Excel file
+    :return: (str): The path of the cache file
+    """
+    return path + CACHE_EXT
+
+
+def getSourceStamp(path):
+    """
+    Gets the size and modification time of a file, used to tell if the Excel file has changed since it was cached
+    :param path: (str): The path of the file to check
+    :return: (list): The file size in bytes and its modification time in nanoseconds
+    """
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def readCellNumber(value):
+    """
+    Converts a cell value from the Excel sheet into a whole number that can be stored in the cache
+    :param value: The value of the cell, can be an int, a String such as '*' or None
+    :return: (int): The number in the cell, or MISSING if the cell has no usable number
+    """
+    if type(value) is int:
+        return value
+    if type(value) is float:
+        return int(value)
+    if value is None:
+        return MISSING
+    # Some cells are Strings, with extra characters around the number, or '*' when the number is suppressed
+    digits = re.sub("[^0-9]", "", str(value))
+    if digits == '':
+        return MISSING
+    return int(digits)
+
+
+def isDate(value):
+    """
+    Checks if a cell value from the Excel sheet is a date
+    :param value: The value of the cell
+    :return: (bool): True if the value is a date or datetime
+    """
+    return hasattr(value, 'toordinal')
+
+
+def findHeaderRow(rows):
+    """
+    Searches the first rows of a sheet for the row of column names
+    The header row is the one that has 'Scotland' and at least one health board name starting with 'NHS', or that
+    starts with a 'Date' column followed by other columns
+    :param rows: (list): The first rows of the sheet, each a tuple of cell values
+    :return: (int): The position of the header row in the given rows, or None if there is no header row
+    """
+    for rowNum, row in enumerate(rows):
+        values = [str(value).strip() for value in row if value is not None]
+        if 'Scotland' in values and any(value.startswith('NHS') for value in values):
+            return rowNum
+        if len(values) > 1 and len(row) > 0 and str(row[0]).strip().lower().startswith('date'):
+            return rowNum
+    return None
+
+
+def readSheet(sheet):
+    """
+    Reads a table of numbers by date from a sheet, in a single forward pass
+    The header row is found by its content, rather than by its position in the sheet
+    :param sheet: (openpyxl.worksheet.read_only.ReadOnlyWorksheet): The sheet to read
+    :return: (dict): The sheet's title, the column names, the sheet row number of the first row of data, the dates as
+                     day numbers and the numbers as a 2D array of columns by dates. None if the sheet has no header row
+    """
+    rows = sheet.iter_rows(values_only=True)
+    topRows = [row for _, row in zip(range(10), rows)]  # The header is within the first few rows
+    headerNum = findHeaderRow(topRows)
+    if headerNum is None:
+        return None
+
+    # Stores the position of each column, skipping any empty columns in the header
+    header = topRows[headerNum]
+    columns = [col for col in range(1, len(header)) if header[col] is not None]
+    names = [str(header[col]).strip() for col in columns]
+
+    dates = array('q')
+    cases = [array('q') for _ in columns]
+    firstRow = headerNum + 2  # Sheet rows start at 1, so this is the row after the header
+    # Continue from the rows already read while searching for the header, then the rest of the sheet
+    for row in itertools.chain(topRows[headerNum + 1:], rows):
+        if not row or not isDate(row[0]):
+            if len(dates) > 0:
+                break  # The end of the data, anything after is notes about the data
+            firstRow += 1  # A blank row between the header and the data
+            continue
+        readDataRow(row, columns, dates, cases)
+
+    dates, data = toArrays(dates, cases)
+    return {'title': sheet.title, 'names': names, 'columns': columns, 'firstRow': firstRow, 'dates': dates,
+            'cases': data}
+
+
+def readDataRow(row, columns, dates, cases):
+    """
+    Adds the date and numbers from a row of a sheet to the table being read
+    :param row: (tuple): The cell values of the row, starting with its date
+    :param columns: (list): The position of each column of numbers in the row
+    :param dates: (array.array): The dates read so far, as day numbers
+    :param cases: (list): The numbers read so far, an array.array for each column
+    """
+    dates.append(row[0].toordinal())
+    for col, values in zip(columns, cases):
+        values.append(readCellNumber(row[col] if col < len(row) else None))
+
+
+def toArrays(dates, cases):
+    """
+    Converts the dates and numbers read from a sheet into numpy arrays
+    :param dates: (array.array): The dates, as day numbers
+    :param cases: (list): The numbers, an array.array for each column
+    :return: (tuple): The dates as a 1D array, and the numbers as a 2D array of columns by dates
+    """
+    import numpy as np
+
+    data = np.array([np.frombuffer(values, dtype='<i8') for values in cases], dtype='<i8').reshape(len(cases), -1)
+    return np.frombuffer(dates, dtype='<i8'), data
+
+
+def canReadSheetXML(sheet):
+    """
+    Checks the sheet's XML can be read straight from the Excel file, which openpyxl does not have a public way to do
+    :param sheet: (openpyxl.worksheet.read_only.ReadOnlyWorksheet): The sheet
+    :return: (bool): True if openpyxl's read only sheet opens its XML with _get_source(), as it does in openpyxl 3.1
+    """
+    return callable(getattr(sheet, '_get_source', None))
+
+
+def findRowsEnd(chunks, lastRow, rows=None):
+    """
+    Finds where the rows up to a row end in a sheet's XML, reading the XML a chunk at a time so it is never all in
+    memory at once, and works out a checksum of the XML of those rows on the way
+    :param chunks: (iterable): The sheet's XML, as chunks of bytes
+    :param lastRow: (int): The sheet row number of the last row
+    :param rows: (tuple): The length and CRC-32 of the XML of the rows before the chunks, if the chunks start part way
+                          through the rows, or None if they start at the beginning of the XML
+    :return: (tuple): The length and the CRC-32 of the XML from the <sheetData> tag to the end of the last row's </row>
+                      tag, or None if the sheet has no rows or the row is not in the XML
+    """
+    # Looked for in turn: the start and end of the <sheetData> tag, then the start and end of the last row
+    tags = [b'<sheetData', b'>', b'<row r="' + str(lastRow).encode() + b'"', b'</row>']
+    found = 0 if rows is None else 2
+    buffer = b''
+    length, checksum = rows or (0, 0)
+    for chunk in chunks:
+        buffer += chunk
+        while found < len(tags):
+            tagStart = buffer.find(tags[found])
+            if tagStart < 0:
+                # Keeps enough of the end of the buffer to find a tag that is split between two chunks
+                used = max(0, len(buffer) - len(tags[found]))
+            else:
+                if found == 1 and buffer[tagStart - 1:tagStart] == b'/':
+                    return None  # <sheetData/>, so the sheet has no rows
+                used = tagStart + len(tags[found])
+            if found >= 2:
+                # The rows have started, so everything passed over is part of the rows
+                checksum = zlib.crc32(memoryview(buffer)[:used], checksum)
+                length += used
+            buffer = buffer[used:]
+            if tagStart < 0:
+                break
+            found += 1
+        if found == len(tags):
+            return length, checksum
+    return None
+
+
+class SkipRowsReader:
+    """
+    Reads a sheet's XML for openpyxl, leaving out the rows that were read into an earlier cache, so openpyxl only parses
+    the new rows. The XML is read a chunk at a time, and the rows left out are checked against their checksum as they
+    are passed over, raising RowsChangedError if any of them have been revised.
+    """
+
+    def __init__(self, source, rowsLength, rowsChecksum):
+        """
+        :param source: (file): The sheet's XML, opened for reading
+        :param rowsLength: (int): The length of the XML of the rows to leave out, from the ingest state
+        :param rowsChecksum: (int): The CRC-32 of the XML of the rows to leave out, from the ingest state
+        """
+        self.source = source
+        self.rowsLength = rowsLength
+        self.rowsChecksum = rowsChecksum
+        self.buffer = None  # The XML read but not yet returned, None until the rows have been left out
+        self.newRows = []  # The chunks of XML read after the rows left out, for the ingest state of the new rows
+
+    def skipRows(self):
+        """
+        Reads the XML up to the <sheetData> tag, then passes over the earlier rows, checking them against their checksum
+        :return: (bytes): The XML up to the <sheetData> tag, followed by the start of the XML after the earlier rows
+        """
+        head = b''
+        tagEnd = -1
+        while tagEnd < 0:
+            chunk = self.source.read(XML_CHUNK)
+            if not chunk:
+                raise RowsChangedError('the sheet has no rows')
+            head += chunk
+            tagStart = head.find(b'<sheetData')
+            tagEnd = head.find(b'>', tagStart) if tagStart >= 0 else -1
+        if head[tagEnd - 1:tagEnd] == b'/':
+            raise RowsChangedError('the sheet has no rows')
+        head, rest = head[:tagEnd + 1], head[tagEnd + 1:]
+
+        remaining = self.rowsLength
+        checksum = 0
+        while True:
+            rows = memoryview(rest)[:remaining]
+            checksum = zlib.crc32(rows, checksum)
+            remaining -= len(rows)
+            if remaining == 0:
+                rest = rest[len(rows):]
+                break
+            rest = self.source.read(XML_CHUNK)
+            if not rest:
+                raise RowsChangedError('the sheet has fewer rows')
+        # The earlier rows have to end where a row starts or the rows end
+        while len(rest) < len(b'</sheetData'):
+            chunk = self.source.read(XML_CHUNK)
+            if not chunk:
+                break
+            rest += chunk
+        if checksum != self.rowsChecksum or not rest.startswith((b'<row', b'</sheetData')):
+            raise RowsChangedError('the earlier rows have been revised')
+        self.newRows.append(rest)
+        return head + rest
+
+    def read(self, size=-1):
+        """
+        :param size: (int): The most bytes to read, or -1 to read to the end
+        :return: (bytes): The next part of the sheet's XML, without the earlier rows
+        """
+        if self.buffer is None:
+            self.buffer = self.skipRows()
+        if not self.buffer:
+            data = self.source.read(size)
+            self.newRows.append(data)
+            return data
+        if size is None or size < 0:
+            data, self.buffer = self.buffer + self.source.read(), b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    def close(self):
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excInfo):
+        self.close()
+
+
+def getPartChecksums(path):
+    """
+    Gets the checksums of the shared strings and styles of an Excel file, which the sheets' XML only refers to by
+    number, so the same XML can mean different values if they change
+    :param path: (str): The path of the Excel file
+    :return: (dict): The CRC-32 of each of INGEST_PARTS, or None for a part the file does not have
+    """
+    import zipfile
+
+    # The zip file lists the CRC-32 of each file in it, so the parts do not need to be read
+    with zipfile.ZipFile(path) as excel:
+        checksums = {info.filename: info.CRC for info in excel.infolist()}
+    return {part: checksums.get(part) for part in INGEST_PARTS}
+
+
+def getIngestState(table, chunks, partChecksums, rows=None):
+    """
+    Records how much of a sheet has been read, so the next day's file only needs its new rows read
+    :param table: (dict): The table read from the sheet, as returned by readSheet()
+    :param chunks: (iterable): The sheet's XML, as chunks of bytes, as for findRowsEnd()
+    :param partChecksums: (dict): The checksums of the Excel file's shared strings and styles, from getPartChecksums()
+    :param rows: (tuple): The length and checksum of the rows before the chunks, as for findRowsEnd()
+    :return: (dict): The position of each column, the last row and date read, the length and checksum of the XML of
+                     every row up to the last row, the checksums of the shared strings and styles, and a checksum of
+                     each column of the table. None if the rows could not be found in the XML
+    """
+    lastRow = table['firstRow'] + len(table['dates']) - 1
+    rows = findRowsEnd(chunks, lastRow, rows)
+    if rows is None:
+        return None
+    return {'columns': table['columns'], 'lastRow': lastRow, 'lastDate': int(table['dates'][-1]),
+            'rowsLength': rows[0], 'rowsChecksum': rows[1], 'partChecksums': partChecksums,
+            'columnChecksums': getColumnChecksums(table['dates'], table['cases'])}
+
+
+def getColumnChecksums(dates, cases):
+    """
+    Works out a checksum of the dates and of each column of numbers in a table
+    :param dates: (numpy.ndarray): The dates, as day numbers
+    :param cases: (numpy.ndarray): The numbers, as a 2D array of columns by dates
+    :return: (list): The CRC-32 of the dates, then of each column
+    """
+    import numpy as np
+
+    return [zlib.crc32(np.ascontiguousarray(column, dtype='<i8').tobytes()) for column in [dates, *cases]]
+
+
+def readNewRows(sheet, base, partChecksums):
+    """
+    Reads a sheet by only reading the rows added since the cache of an earlier file was built, and copying the rest
+    from that cache. The earlier rows are checked against a checksum of their XML, and the shared strings and styles
+    against theirs, so the sheet is read in full instead if any of them have been revised.
+    :param sheet: (openpyxl.worksheet.read_only.ReadOnlyWorksheet): The sheet to read
+    :param base: (dict): The path and header length of the earlier cache, and the details of the sheet's table in it
+    :param partChecksums: (dict): The checksums of the Excel file's shared strings and styles, from getPartChecksums()
+    :return: (dict): The table, as returned by readSheet(), with its ingest state added as 'ingest' if it could be worked
+                     out from the new rows. None if the sheet has to be read in full
+    """
+    import numpy as np
+
+    details = base['details']
+    state = details.get('ingest')
+    if state is None or state.get('partChecksums') != partChecksums:
+        return None  # A changed shared string or style can change the value of an earlier cell without changing its XML
+    oldData = mapCacheTable(base['path'], base['headerLength'], details)
+    if getColumnChecksums(oldData[0], oldData[1:]) != state['columnChecksums']:
+        return None  # The earlier cache has been changed since it was built
+
+    # Gives openpyxl the sheet without the earlier rows, so it only has to parse the new ones
+    getSource = sheet._get_source
+    readers = []
+
+    def getNewRowsSource():
+        readers.append(SkipRowsReader(getSource(), state['rowsLength'], state['rowsChecksum']))
+        return readers[-1]
+
+    sheet._get_source = getNewRowsSource
+    columns = state['columns']
+    dates = array('q')
+    cases = [array('q') for _ in columns]
+    try:
+        for row in sheet.iter_rows(min_row=state['lastRow'] + 1, values_only=True):
+            if not row or not isDate(row[0]):
+                break  # The end of the data, anything after is notes about the data
+            readDataRow(row, columns, dates, cases)
+    except RowsChangedError:
+        return None
+    finally:
+        del sheet._get_source  # Goes back to openpyxl's own method, in case the sheet is read in full
+    dates, data = toArrays(dates, cases)
+    if len(dates) > 0 and dates[0] <= state['lastDate']:
+        return None  # The new rows do not follow on from the earlier rows
+
+    table = {'title': sheet.title, 'names': details['names'], 'columns': columns, 'firstRow': details['firstRow'],
+             'dates': np.concatenate([oldData[0], dates]), 'cases': np.hstack([oldData[1:], data])}
+    if len(dates) == 0:
+        table['ingest'] = state
+    elif readers:
+        # Carries the checksum of the earlier rows on through the new rows, instead of reading the sheet again
+        table['ingest'] = getIngestState(table, readers[-1].newRows, partChecksums,
+                                         (state['rowsLength'], state['rowsChecksum']))
+    return table
+
+
+def readCumulativeCases(path):
+    """
+    Reads the cumulative cases sheet from an Excel file, in a single forward pass using openpyxl's read only mode
+    The sheet and its header row are found by their content, rather than by their position in the file
+    :param path: (str): The path of the Excel file
+    :return: (dict): The sheet's title, the health board names, the sheet row number of the first row of data,
+                     the dates as day numbers and the case numbers as a 2D array of health boards by dates
+    """
+    from openpyxl import load_workbook  # Only needed when the Excel file has to be read
+
+    # Read only mode streams the rows from the file, instead of loading every cell into memory
+    excel = load_workbook(path, read_only=True, data_only=True)
+    try:
+        # Check the cumulative cases sheet first, in case other sheets also have a row of health board names
+        for sheet in sorted(excel.worksheets, key=lambda theSheet: 'cumulative' not in theSheet.title.lower()):
+            data = readSheet(sheet)
+            if data is not None:
+                return data
+    finally:
+        excel.close()  # Read only mode keeps the file open until it is closed
+    print('Error! Could not find the cumulative cases sheet in ' + path + '\nIt is possible the layout of the file '
+          'has changed.', file=statusOutput)
+    sys.exit()
+
+
+def readTable(path, title, base=None):
+    """
+    Reads one sheet from an Excel file, opening the file separately so each sheet can be read in its own process
+    :param path: (str): The path of the Excel file
+    :param title: (str): The title of the sheet to read
+    :param base: (dict): The sheet's table in the cache of an earlier file, as for readNewRows(), or None to read the
+                         whole sheet
+    :return: (dict): The table, as returned by readSheet(), with the state from getIngestState() added as 'ingest'.
+                     None if the sheet has no table of numbers by date
+    """
+    from openpyxl import load_workbook
+
+    excel = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = excel[title]
+        canSkip = canReadSheetXML(sheet)
+        partChecksums = getPartChecksums(path) if canSkip else None
+        table = None
+        if base is not None and canSkip:
+            table = readNewRows(sheet, base, partChecksums)
+        if table is None:
+            table = readSheet(sheet)
+        if table is not None and not canSkip:
+            print('Warning: the installed version of openpyxl can not read only the new rows of the ' + title +
+                  ' sheet, so it is read in full each time', file=sys.stderr)
+        if table is not None and canSkip and len(table['dates']) > 0 and table.get('ingest') is None:
+            with sheet._get_source() as source:
+                table['ingest'] = getIngestState(table, iter(lambda: source.read(XML_CHUNK), b''), partChecksums)
+        return table
+    finally:
+        excel.close()
+
+
+def readAllTables(path, base=None):
+    """
+    Reads every sheet with a table of numbers by date from an Excel file, e.g. cumulative cases, ICU and hospital
+    patients. Each sheet is read in a separate process, so reading them all takes about as long as the slowest sheet,
+    and an error in one sheet does not stop the others from being read.
+    :param path: (str): The path of the Excel file
+    :param base: (dict): The cache of an earlier file, as returned by findBaseCache(), so only the rows added since
+                         then need to be read. None to read every sheet in full
+    :return: (list): The tables, as returned by readTable(), in the same order as the sheets
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from openpyxl import load_workbook
+
+    excel = load_workbook(path, read_only=True, data_only=True)
+    titles = excel.sheetnames
+    excel.close()
+
+    # The table for each sheet in the earlier cache, a sheet that was not in it is read in full
+    baseTables = {}
+    if base is not None:
+        baseTables = {details['title']: {'path': base['path'], 'headerLength': base['headerLength'],
+                                         'details': details} for details in base['tables']}
+
+    workers = min(len(titles), os.cpu_count() or 1)
+    if workers > 1:
+        # Forking a process while other threads are running, e.g. the server's, can leave a lock held by one of those
+        # threads locked forever in the new process, so new processes are started from scratch instead
+        context = multiprocessing.get_context('spawn') if threading.active_count() > 1 else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(readTable, path, title, baseTables.get(title)) for title in titles]
+            results = [(title, future.result) for title, future in zip(titles, futures)]
+            return collectTables(results)
+    # With a single CPU, starting another process would only add to the time taken
+    return collectTables([(title, functools.partial(readTable, path, title, baseTables.get(title)))
+                          for title in titles])
+
+
+def collectTables(results):
+    """
+    Gets the result of reading each sheet, skipping any sheet that could not be read or has no table of numbers
+    :param results: (list): The title of each sheet, with a function that returns the table read from it
+    :return: (list): The tables, as returned by readSheet(), in the same order as the sheets
+    """
+    tables = []
+    for title, getResult in results:
+        try:
+            table = getResult()
+        except Exception as error:
+            print('Error! Could not read the sheet ' + title + ', skipping it: ' + str(error), file=statusOutput)
+            continue
+        if table is not None and len(table['dates']) > 0:
+            tables.append(table)
+    return tables
+
+
+def buildCache(path, table=None):
+    """
+    Reads every table from the given Excel file and writes them into a binary cache file
+    The cache holds a JSON header, followed by one int64 array of dates and one int64 array per column for each table
+    :param path: (str): The path of the Excel file
+    :param table: (str): The table to return, as for loadCache()
+    :return: (dict): The cached data, as returned by loadCache()
+    """
+    import numpy as np
+
+    tables = readAllTables(path, findBaseCache(path))
+    if not any(isCasesTable(theTable) for theTable in tables):
+        tables.insert(0, readCumulativeCases(path))  # Stops with an error if there is no cumulative cases sheet
+
+    # Each table is stored with row 0 as the dates as day numbers, then the columns in the same order as the names
+    header = {'version': CACHE_VERSION, 'source': getSourceStamp(path), 'tables': []}
+    blocks = []
+    offset = 0
+    for theTable in tables:
+        rows = len(theTable['dates'])
+        blocks.append(np.vstack([theTable['dates'].reshape(1, rows), theTable['cases']]).astype('<i8'))
+        header['tables'].append({'title': theTable['title'], 'names': theTable['names'],
+                                 'firstRow': theTable['firstRow'], 'rows': rows, 'offset': offset,
+                                 'ingest': theTable.get('ingest')})
+        offset += blocks[-1].nbytes
+    headerBytes = json.dumps(header).encode('utf-8')
+    # Pad the header so the arrays start on an 8 byte boundary, which lets them be memory mapped
+    start = len(CACHE_MAGIC) + 4 + len(headerBytes)
+    headerBytes += b' ' * (-start % 8)
+
+    # Writes to a temporary file first, so other runs never see a half written cache
+    cachePath = getCachePath(path)
+    with open(cachePath + '.tmp', 'wb') as cacheFile:
+        cacheFile.write(CACHE_MAGIC)
+        cacheFile.write(struct.pack('<I', len(headerBytes)))
+        cacheFile.write(headerBytes)
+        for block in blocks:
+            cacheFile.write(block.tobytes())
+    os.replace(cachePath + '.tmp', cachePath)
+    return loadCache(path, table)
+
+
+def isCasesTable(table):
+    """
+    Checks whether a table could be the cumulative cases table
+    :param table: (dict): The table, or the details of a table in the cache
+    :return: (bool): True if the table's title mentions cumulative cases, or it has a column for all of Scotland
+    """
+    return 'cumulative' in table['title'].lower() or 'Scotland' in table['names']
+
+
+def isRunningTotal(table):
+    """
+    Checks whether a table's numbers are running totals, such as cumulative cases, rather than a count on each day that
+    can go down, such as ICU patients
+    :param table: (dict): The table, or the details of a table in the cache
+    :return: (bool): True if the table's title mentions cumulative
+    """
+    return 'cumulative' in table['title'].lower()
+
+
+def selectTable(tables, table):
+    """
+    Finds the table to use, from the tables in the cache
+    :param tables: (list): The details of each table in the cache
+    :param table: (str): Part of the title of the table, e.g. ICU, or None for the cumulative cases table
+    :return: (dict): The details of the table
+    """
+    if table is None:
+        # The cumulative cases table, or the first table of health boards if the sheet name has changed
+        cumulative = [theTable for theTable in tables if 'cumulative' in theTable['title'].lower()]
+        return (cumulative + [theTable for theTable in tables if isCasesTable(theTable)] + tables)[0]
+    for theTable in tables:
+        if table.lower() in theTable['title'].lower():
+            return theTable
+    raise QueryError('ERROR: There is no table matching ' + table + '. Please enter part of one of the following:\n' +
+                     str([theTable['title'] for theTable in tables]))
+
+
+def loadCache(path, table=None):
+    """
+    Memory maps one table from the binary cache of the given Excel file
+    :param path: (str): The path of the Excel file
+    :param table: (str): Part of the title of the table, e.g. ICU, or None for the cumulative cases table
+    :return: (dict): The table's title, the titles of all of the tables, the column names, the first row number, the
+                     size and time of the Excel file, the dates and the case numbers.
+                     None if there is no cache, or the Excel file has changed since it was built
+    """
+    cachePath = getCachePath(path)
+    cacheHeader = readCacheHeader(cachePath)
+    try:
+        if cacheHeader is None or cacheHeader[1]['source'] != getSourceStamp(path):
+            return None  # The cache is out of date, so needs to be rebuilt
+    except OSError:
+        return None
+    headerLength, header = cacheHeader
+
+    details = selectTable(header['tables'], table)
+    data = mapCacheTable(cachePath, headerLength, details)
+    return {'title': details['title'], 'tables': [theTable['title'] for theTable in header['tables']],
+            'names': details['names'], 'firstRow': details['firstRow'], 'source': header['source'], 'dates': data[0],
+            'cases': data[1:]}
+
+
+def readCacheHeader(cachePath):
+    """
+    Reads the header of a binary cache file
+    :param cachePath: (str): The path of the cache file
+    :return: (tuple): The length of the header in bytes and the header. None if the file is not a cache, or was
+                      written by another version of the program
+    """
+    try:
+        with open(cachePath, 'rb') as cacheFile:
+            if cacheFile.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            headerLength = struct.unpack('<I', cacheFile.read(4))[0]
+            header = json.loads(cacheFile.read(headerLength).decode('utf-8'))
+    except (OSError, ValueError, struct.error):
+        return None
+    if header.get('version') != CACHE_VERSION:
+        return None
+    return headerLength, header
+
+
+def mapCacheTable(cachePath, headerLength, details):
+    """
+    Memory maps one table from a binary cache file
+    :param cachePath: (str): The path of the cache file
+    :param headerLength: (int): The length of the cache's header in bytes
+    :param details: (dict): The details of the table from the cache's header
+    :return: (numpy.memmap): The table, with row 0 as the dates as day numbers, then a row for each column
+    """
+    import numpy as np
+
+    offset = len(CACHE_MAGIC) + 4 + headerLength + details['offset']
+    return np.memmap(cachePath, dtype='<i8', mode='r', offset=offset, shape=(len(details['names']) + 1,
+                                                                              details['rows']))
+
+
+def findBaseCache(path):
+    """
+    Finds the newest cache of another Excel file in the same directory, e.g. yesterday's file, so a new file only
+    needs the rows added since then to be read
+    :param path: (str): The path of the Excel file being read
+    :return: (dict): The path of the cache, the length of its header and the details of its tables, or None if there
+                     is no other cache
+    """
+    directory = os.path.dirname(path) or '.'
+    cachePath = os.path.abspath(getCachePath(path))
+    caches = [os.path.join(directory, theFile) for theFile in os.listdir(directory) if theFile.endswith(CACHE_EXT)]
+    caches = [theFile for theFile in caches if os.path.abspath(theFile) != cachePath]
+    for theFile in sorted(caches, key=os.path.getmtime, reverse=True):
+        cacheHeader = readCacheHeader(theFile)
+        if cacheHeader is not None:
+            return {'path': theFile, 'headerLength': cacheHeader[0], 'tables': cacheHeader[1]['tables']}
+    return None
+
+
+def loadData(path, table=None):
+    """
+    Loads the covid data from the given Excel file, using its binary cache if it is up to date, otherwise builds it
+    :param path: (str): The path of the Excel file
+    :param table: (str): Part of the title of the table to load, e.g. ICU, or None for the cumulative cases table
+    :return: (dict): The cached data, as returned by loadCache(), with the filled in case numbers added as 'matrix'
+                     and the index from buildIndex() added as 'index'
+    """
+    directory = os.path.dirname(path) or '.'
+    # Only the ExcelFiles directory is shared with other runs, so a file given with -f is not locked, which would leave
+    # a lock file in the user's own directory
+    lockFiles = os.path.abspath(directory) == os.path.abspath('ExcelFiles')
+    with lockDirectory(directory, shared=True) if lockFiles else contextlib.nullcontext():
+        with phaseTimer('loadCache'):
+            data = loadCache(path, table)
+    if data is None:
+        # Only one run at a time builds the cache, any others wait for it then use the cache it built
+        with lockDirectory(directory) if lockFiles else contextlib.nullcontext():
+            data = loadCache(path, table)
+            if data is None:
+                with phaseTimer('buildCache'):
+                    data = buildCache(path, table)
+    with phaseTimer('prepareData'):
+        return prepareData(data)
+
+
+def prepareData(data):
+    """
+    Adds the filled in case numbers and the index to the covid data, ready for queries
+    :param data: (dict): The covid data, as returned by loadCache() or loadSnapshot()
+    :return: (dict): The same dict, with the case numbers added as 'matrix', filled in if they are running totals, the
+                     index as 'index' and the health board name index as 'nameIndex'
+    """
+    # The case numbers as a matrix, with a row for each date and a column for each health board. Only running totals
+    # can be filled in with the last number given, a count such as ICU patients may have gone down since then
+    data['matrix'] = fillMissing(data['cases'].T) if isRunningTotal(data) else data['cases'].T
+    data['index'] = buildIndex(data)
+    data['nameIndex'] = buildNameIndex(data['names'])
+    return data
+
+
+def getPublishDate(file):
+    """
+    Gets the date the covid data was published, from the name of the Excel file, e.g. COVID-19-25October2020.xlsx
+    :param file: (str): The name of the Excel file
+    :return: (datetime.date): The date in the file name, or None if the name has no date
+    """
+    from datetime import datetime
+
+    match = re.search('([0-9]{1,2}[A-Za-z]+[0-9]{4})', file)
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(match.group(1), '%d%B%Y').date()
+    except ValueError:
+        return None
+
+
+def getSnapshotDir():
+    """
+    Gets the directory that stores the snapshots of older covid data, making it if it does not exist
+    :return: (str): The path of the snapshot directory
+    """
+    path = os.path.join('ExcelFiles', SNAPSHOT_DIR)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
+
+
+def readSnapshotIndex():
+    """
+    Reads the list of snapshots, in order of the date they were published
+    :return: (list): The details of each snapshot, as saved by addSnapshot()
+    """
+    try:
+        with open(os.path.join('ExcelFiles', SNAPSHOT_DIR, 'index.json')) as indexFile:
+            return json.load(indexFile)['snapshots']
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def addSnapshot(path, published):
+    """
+    Adds the covid data from an Excel file to the snapshot store, so it can be queried after the file is removed
+    Each snapshot only stores the rows that are different from the previous snapshot, as the data mostly grows by
+    one row a day. Every SNAPSHOT_KEYFRAME snapshots, all of the rows are stored, to limit how many snapshots have
+    to be read to rebuild one.
+    :param path: (str): The path of the Excel file
+    :param published: (datetime.date): The date the data was published
+    """
+    snapshots = readSnapshotIndex()
+    if any(snapshot['published'] == published.isoformat() for snapshot in snapshots):
+        return  # Already stored
+
+    import numpy as np
+
+    data = loadCache(path)
+    if data is None:
+        # Builds the cache, rather than only reading the sheet, as it can use the cache of an older file to only read
+        # the new rows, and the newest file's cache is used by the query straight after
+        data = buildCache(path)
+    dates = np.asarray(data['dates'], dtype='<i8')
+    cases = np.asarray(data['cases'], dtype='<i8')
+
+    # Finds how many rows are the same as the snapshot published before this one
+    older = [snapshot for snapshot in snapshots if snapshot['published'] < published.isoformat()]
+    base = older[-1] if len(older) > 0 else None
+    shared = 0
+    if base is not None and base['names'] == data['names'] and base['depth'] + 1 < SNAPSHOT_KEYFRAME:
+        baseDates, baseCases = readSnapshot(base['published'], snapshots)
+        rows = min(len(baseDates), len(dates))
+        same = (baseDates[:rows] == dates[:rows]) & (baseCases[:, :rows] == cases[:, :rows]).all(axis=0)
+        shared = rows if same.all() else int(np.argmin(same))
+    if shared == 0:
+        base = None  # Nothing in common, so store all of the rows
+
+    # Stores the new rows' dates, followed by each health board's new rows, compressed
+    blockName = published.isoformat() + '.block'
+    blockPath = os.path.join(getSnapshotDir(), blockName)
+    with open(blockPath + '.tmp', 'wb') as blockFile:
+        blockFile.write(zlib.compress(dates[shared:].tobytes() + np.ascontiguousarray(cases[:, shared:]).tobytes()))
+    os.replace(blockPath + '.tmp', blockPath)
+
+    snapshots.append({'published': published.isoformat(), 'file': blockName, 'names': data['names'],
+                      'firstRow': data['firstRow'], 'rows': len(dates), 'shared': shared,
+                      'base': None if base is None else base['published'],
+                      'depth': 0 if base is None else base['depth'] + 1})
+    snapshots.sort(key=lambda snapshot: snapshot['published'])
+    indexPath = os.path.join(getSnapshotDir(), 'index.json')
+    with open(indexPath + '.tmp', 'w') as indexFile:
+        json.dump({'snapshots': snapshots}, indexFile)
+    os.replace(indexPath + '.tmp', indexPath)
+
+
+def readSnapshot(published, snapshots):
+    """
+    Rebuilds the covid data of a snapshot, from its own rows and the rows it shares with the snapshots before it
+    :param published: (str): The date the snapshot was published, in YYYY-MM-DD format
+    :param snapshots: (list): The details of each snapshot, as returned by readSnapshotIndex()
+    :return: (tuple): The dates as day numbers and the case numbers as a 2D array of health boards by dates
+    """
+    import numpy as np
+
+    snapshot = next(theSnapshot for theSnapshot in snapshots if theSnapshot['published'] == published)
+    newRows = snapshot['rows'] - snapshot['shared']
+    with open(os.path.join('ExcelFiles', SNAPSHOT_DIR, snapshot['file']), 'rb') as blockFile:
+        block = zlib.decompress(blockFile.read())
+    dates = np.frombuffer(block, dtype='<i8', count=newRows)
+    cases = np.frombuffer(block, dtype='<i8', offset=newRows * 8).reshape(len(snapshot['names']), newRows)
+    if snapshot['base'] is None:
+        return dates, cases
+    baseDates, baseCases = readSnapshot(snapshot['base'], snapshots)
+    shared = snapshot['shared']
+    return np.concatenate([baseDates[:shared], dates]), np.hstack([baseCases[:, :shared], cases])
+
+
+def findSnapshot(day, snapshots):
+    """
+    Finds the newest snapshot published on or before the given date
+    :param day: (datetime.date): The date to find the data as it was published on
+    :param snapshots: (list): The details of each snapshot, as returned by readSnapshotIndex()
+    :return: (dict): The details of the snapshot
+    """
+    older = [snapshot for snapshot in snapshots if snapshot['published'] <= day.isoformat()]
+    if len(older) == 0:
+        published = ', '.join(snapshot['published'] for snapshot in snapshots)
+        raise QueryError('ERROR: There is no data published on or before ' + day.isoformat() +
+                         '. Data is stored for: ' + (published if published else 'no dates yet'))
+    return older[-1]
+
+
+def loadSnapshot(day):
+    """
+    Loads the covid data as it was published on the given date, from the snapshot store
+    :param day: (datetime.date): The date to load the data as it was published on
+    :return: (dict): The covid data, in the same format as loadData()
+    """
+    snapshots = readSnapshotIndex()
+    snapshot = findSnapshot(day, snapshots)
+    dates, cases = readSnapshot(snapshot['published'], snapshots)
+    return prepareData({'title': 'cumulative cases', 'tables': [], 'names': snapshot['names'],
+                        'firstRow': snapshot['firstRow'], 'source': None, 'dates': dates, 'cases': cases})
+
+
+def getRevisions(oldDay, newDay):
+    """
+    Compares the covid data as it was published on two dates, finding the case numbers that were changed
+    Only the dates in both sets of data are compared, as newer data also has the days since the older data
+    :param oldDay: (datetime.date): The date the older data was published
+    :param newDay: (datetime.date): The date the newer data was published
+    :return: (list): Each change, as a tuple of the date, the health board, the older number and the newer number
+    """
+    import numpy as np
+
+    snapshots = readSnapshotIndex()
+    old = findSnapshot(oldDay, snapshots)
+    new = findSnapshot(newDay, snapshots)
+    oldDates, oldCases = readSnapshot(old['published'], snapshots)
+    newDates, newCases = readSnapshot(new['published'], snapshots)
+
+    _, oldRows, newRows = np.intersect1d(oldDates, newDates, return_indices=True)
+    changes = []
+    for name in old['names']:
+        if name not in new['names']:
+            continue
+        oldValues = oldCases[old['names'].index(name), oldRows]
+        newValues = newCases[new['names'].index(name), newRows]
+        for row in np.flatnonzero(oldValues != newValues):
+            changes.append((date.fromordinal(int(oldDates[oldRows[row]])).isoformat(), name,
+                            None if oldValues[row] == MISSING else int(oldValues[row]),
+                            None if newValues[row] == MISSING else int(newValues[row])))
+    changes.sort()
+    return changes
+
+
+def fillMissing(cases):
+    """
+    Fills in the suppressed and empty cells, with the last number given for that health board
+    Any cells before a health board's first number are set to 0, as they were suppressed for being less than 5
+    :param cases: (numpy.ndarray): The case numbers, with a row for each date and a column for each health board
+    :return: (numpy.ndarray): A copy of the case numbers, with no missing values
+    """
+    import numpy as np
+
+    missing = cases == MISSING
+    # For each cell, store the row number of the last row with a value in that column, then use it to get the values
+    lastGiven = np.where(missing, 0, np.arange(len(cases)).reshape(-1, 1))
+    np.maximum.accumulate(lastGiven, axis=0, out=lastGiven)
+    filled = cases[lastGiven, np.arange(cases.shape[1])]
+    filled[filled == MISSING] = 0
+    return filled
+
+
+def buildIndex(data):
+    """
+    Works out the running totals once, so queries over any period are a subtraction of two rows
+    :param data: (dict): The loaded covid data, with the filled in case numbers as 'matrix'
+    :return: (dict): The running total of daily cases with a row of 0s in front ('prefix'), the position of the first
+                     row where every health board has a number ('firstComplete') and whether the dates have no gaps
+                     ('consecutive')
+    """
+    import numpy as np
+
+    matrix = data['matrix']
+    # prefix[row] is the total of the daily cases before that row, so the cases from row a to row b is
+    # prefix[b + 1] - prefix[a]. The sheet has cumulative cases, so this is the sheet's totals with a row of 0s in front
+    prefix = np.vstack([np.zeros((1, matrix.shape[1]), dtype=matrix.dtype), matrix])
+
+    # When cases were less than 5, '*' was displayed for disclosure reasons, so periods should only start
+    # after the first row where every health board has a number
+    complete = np.flatnonzero((data['cases'] != MISSING).all(axis=0))
+    firstComplete = int(complete[0]) if len(complete) > 0 else len(matrix) - 1
+
+    dates = data['dates']
+    consecutive = len(dates) == 0 or int(dates[-1]) - int(dates[0]) == len(dates) - 1
+    return {'prefix': prefix, 'firstComplete': firstComplete, 'consecutive': consecutive}
+
+
+def getCache():
+    """
+    Gets the covid data to answer a query with
+    :return: (dict): The data the server's thread started its query with, otherwise the loaded covid data
+    """
+    return getattr(queryData, 'cache', cache)
+
+
+def getDateRow(day, first=False):
+    """
+    Finds the row of data for the given date
+    :param day: (datetime.date): The date to find
+    :param first: (bool): If the date has no row, True to use the first row after it, e.g. for the start of a range,
+                          or False to use the last row before it
+    :return: (int): The position of the row in the data
+    """
+    import numpy as np
+
+    dates = getCache()['dates']
+    ordinal = day.toordinal()
+    if len(dates) == 0 or ordinal < dates[0] or ordinal > dates[-1]:
+        raise QueryError('ERROR: There is no data for ' + day.isoformat() + '. Please enter a date between ' +
+                         date.fromordinal(int(dates[0])).isoformat() + ' and ' +
+                         date.fromordinal(int(dates[-1])).isoformat())
+    if getCache()['index']['consecutive']:
+        return ordinal - int(dates[0])  # One row per day, so the row is the number of days after the first date
+    if first:
+        return int(np.searchsorted(dates, ordinal, side='left'))  # The first row on or after the given date
+    # Otherwise, use the last row on or before the given date
+    return int(np.searchsorted(dates, ordinal, side='right')) - 1
 
 
 def getHealthBoardList():
@@ -123,12 +1522,27 @@ def getHealthBoardList():
     Reads the covid data and returns all of the health boards
     :return: (list): A list of each Health Board name as a Strings
     """
-    healthBoardsList = []  # Used to store all the health board names
-    # Loops from the first available health board name (col 2) to the last health board name (col 16)
-    for row in sheet.iter_rows(min_row=3, min_col=2, max_row=3, max_col=16):
-        for cell in row:  # Get the cell of the iteration
-            healthBoardsList.append(cell.value)  # Add the health board name to the list
-    return healthBoardsList
+    # The health board names are read from the header row when the cache is built
+    return list(getCache()['names'])
+
+
+def getNumber(value):
+    """
+    Converts a number from the covid data for output
+    :param value: (int): The number, or MISSING if it was suppressed, which only stays in tables that are not running
+                         totals
+    :return: (int): The number, or None if it was suppressed
+    """
+    return None if value == MISSING else int(value)
+
+
+def checkRunningTotal():
+    """
+    Checks the covid data is a running total, so the cases over a period are the difference between two of its rows
+    """
+    if not isRunningTotal(getCache()):
+        raise QueryError('ERROR: The ' + getCache()['title'] + ' table is not a running total, so -n, -c, -r and -ra can not '
+                         'be used with it. Use -s, -a or -t for its newest numbers')
 
 
 def getNewest():
@@ -136,37 +1550,30 @@ def getNewest():
     Reads the covid data and returns the total cases for all health boards
     :return: (list): A list of each health boards covid numbers
     """
-    newDataList = []  # The list to store the case values
-    for col in range(2, 17):  # Loop each health board area & Scottish total
-        cell = sheet.cell(row=lastRowNum, column=col)  # Store the cell for the current health board on the row
-        newDataList.append(cell.value)  # Get the data for that cell  (stores case numbers)
-    return newDataList  # Returns all the case values in the list
+    # The last row of data holds the newest total for each health board
+    return [getNumber(value) for value in getCache()['matrix'][-1].tolist()]
 
 
 def getScotlandTotal():
     """
     Reads the covid data to find the total cases for Scotland
-    :return: (str): The total cases in Scotland as a String
+    :return: (int): The total cases in Scotland
     """
-    # Reads the last column of data, on the last row of data, and returns that cells value
-    data = sheet.cell(row=lastRowNum, column=16).value
-    if type(data) is not int:
-        data = int(re.sub("[^0-9]", "", data))
-    return int(data)
+    column = getHealthBoardColumnNum('Scotland')
+    if column is None:
+        raise QueryError('ERROR: The ' + getCache()['title'] + ' table does not have a total for Scotland')
+    # Reads the Scotland column of data, on the last row of data
+    return getNumber(getCache()['matrix'][-1, column - 2])
 
 
 def getHealthBoardTotal(healthBoard):
     """
     Takes a health boards name, returning its total cases
     :param healthBoard: (str): The name of the health board to check for
-    :return: (str): The number of cases from the excel sheet
+    :return: (int): The number of cases from the excel sheet
     """
     columnNum = getHealthBoardColumnNum(healthBoard)  # Gets the column number, for the given health board
-    newData = getNewest()  # Stores all of the newest available total cases in a list
-    data = newData[columnNum - 2]
-    if type(data) is not int:
-        data = int(re.sub("[^0-9]", "", data))
-    return data  # From the list of data, select the element from the given column num
+    return getNumber(getCache()['matrix'][-1, columnNum - 2])  # From the newest row of data, select the given column
 
 
 def getHealthBoardColumnNum(healthBoard):
@@ -175,11 +1582,7 @@ def getHealthBoardColumnNum(healthBoard):
     :param healthBoard: (str): The name of the health board
     :return: (int): The column number from the excel sheet
     """
-    for col in range(2, 17):  # Loops all of the columns of health boards
-        if sheet.cell(row=3, column=col).value == healthBoard:  # Check if the current health board matches the request
-            # Remove 2 from the column number, as the column in excel, starts at 2
-            # so removing 2 the first element back to 1, so it becomes the 'first' column again
-            return col  # Returns the column number
+    return getCache()['nameIndex']['columns'].get(healthBoard)
 
 
 def getHealthBoardPeriod(timePeriod, healthBoard='all'):
@@ -187,58 +1590,83 @@ def getHealthBoardPeriod(timePeriod, healthBoard='all'):
     Reads the covid data for the health boards covid cases, over the given period
     :param healthBoard: (str): The name of the health board to check data for. Use 'all' to get all health boards cases
     :param timePeriod: (int): The amount of days of data to check back for
-    :return: (list): A list of the cases from either all health boards or the specifically requested one
+    :return: (list or int): A list of the cases from all health boards, or the cases for the requested one
     """
-    # 39 was selected due to formatting in the Gov file
-    # When cases were less than 5, as '*' was displayed, for disclosure reasons
-    # So, to avoid a ValueError, 39 was the first row of data to not have an *
-    maxRow = lastRowNum - 39
+    checkRunningTotal()
+    # Only allow periods that start after the first row where every health board has a number
+    maxRow = len(getCache()['dates']) - 1 - getCache()['index']['firstComplete']
     try:
         length = int(timePeriod)
     except ValueError:
-        print('ERROR: You must give a number between 1 and ' + str(maxRow) + '\nEnding Program.')
-        sys.exit()
+        raise QueryError('ERROR: You must give a number between 1 and ' + str(maxRow) + '\nEnding Program.')
     if int(length) < 1 or int(length) > maxRow:
-        print('ERROR: Given days value is not valid for the data available. Please enter a days value between 1 and ' + str(maxRow))
-        sys.exit()
+        raise QueryError('ERROR: Given days value is not valid for the data available. Please enter a days value '
+                         'between 1 and ' + str(maxRow))
 
+    # The cases over the period are the difference between the newest totals and the totals from the given days ago
+    prefix = getCache()['index']['prefix']
     if healthBoard == 'all':
-        print('Getting all health boards cases over ' + str(length) + ' days')
-        healthBoardList = []
-        for col in range(2, 17):
-            newCell = sheet.cell(row=lastRowNum, column=col).value
-            olderCell = sheet.cell(row=lastRowNum - length, column=col).value
-            # Check if value is none, if so, go back until the row has an actual value
-            if newCell is None:
-                count = 0
-                while newCell is None:
-                    count += 1
-                    newCell = sheet.cell(row=lastRowNum-count, column=col).value
-            if olderCell is None:
-                count = 0
-                while olderCell is None:
-                    count += 1
-                    olderCell = sheet.cell(row=lastRowNum - length - count, column=col).value
-            if type(newCell) is not int:
-                newCell = int(re.sub("[^0-9]", "", newCell))
-            if type(olderCell) is not int:
-                olderCell = int(re.sub("[^0-9]", "", olderCell))
-            data = int(newCell) - int(olderCell)
-            healthBoardList.append(data)
-        return healthBoardList
+        return (prefix[-1] - prefix[-1 - length]).tolist()
     else:
-        print('Getting the last ' + str(length) + ' days of cases for ' + healthBoard)
-        healthBoardColNum = getHealthBoardColumnNum(healthBoard)
-        newCell = sheet.cell(row=lastRowNum, column=healthBoardColNum).value
-        olderCell = sheet.cell(row=lastRowNum - length, column=healthBoardColNum).value
-        return newCell - olderCell
+        col = getHealthBoardColumnNum(healthBoard) - 2
+        return int(prefix[-1, col] - prefix[-1 - length, col])
+
+
+def getHealthBoardRange(fromDate, toDate, healthBoard='all'):
+    """
+    Reads the covid data for the health boards covid cases, between two dates
+    :param fromDate: (datetime.date): The first day to count cases for, or None to start from the first date
+    :param toDate: (datetime.date): The last day to count cases for, or None to end on the newest date
+    :param healthBoard: (str): The name of the health board to check data for. Use 'all' to get all health boards cases
+    :return: (list or int): A list of the cases from all health boards, or the cases for the requested one
+    """
+    checkRunningTotal()
+    if fromDate is not None and toDate is not None and fromDate > toDate:
+        raise QueryError('ERROR: The --from date must be on or before the --to date')
+    fromRow = 0 if fromDate is None else getDateRow(fromDate, first=True)
+    toRow = len(getCache()['dates']) - 1 if toDate is None else getDateRow(toDate)
+    # When the dates have gaps, a range between two rows has no rows, so no cases
+    fromRow = min(fromRow, toRow + 1)
+
+    prefix = getCache()['index']['prefix']
+    if healthBoard == 'all':
+        return (prefix[toRow + 1] - prefix[fromRow]).tolist()
+    col = getHealthBoardColumnNum(healthBoard) - 2
+    return int(prefix[toRow + 1, col] - prefix[fromRow, col])
+
+
+def getHealthBoardAverage(window, toDate=None, healthBoard='all'):
+    """
+    Reads the rolling average of the daily covid cases, over the given number of days
+    :param window: (int): The number of days to average over, one of ROLLING_WINDOWS
+    :param toDate: (datetime.date): The last day of the average, or None to end on the newest date
+    :param healthBoard: (str): The name of the health board to check data for. Use 'all' to get all health boards cases
+    :return: (list or float): A list of the averages for all health boards, or the average for the requested one
+    """
+    checkRunningTotal()
+    try:
+        window = int(window)
+    except ValueError:
+        window = None
+    if window not in ROLLING_WINDOWS:
+        raise QueryError('ERROR: The number of days to average over must be one of ' +
+                         ', '.join(str(days) for days in ROLLING_WINDOWS))
+
+    row = len(getCache()['dates']) - 1 if toDate is None else getDateRow(toDate)
+    # The total over the window ending on the row, divided by the number of days in it, as the first rows have fewer
+    start = max(row + 1 - window, 0)
+    prefix = getCache()['index']['prefix']
+    average = (prefix[row + 1] - prefix[start]) / (row + 1 - start)
+    if healthBoard == 'all':
+        return [round(value, 1) for value in average.tolist()]
+    return round(float(average[getHealthBoardColumnNum(healthBoard) - 2]), 1)
 
 
 def outputData(locations, values):
     """
     Ouputs the health board and case numbers in a tabulated list
     :param locations: (list or str): A list of all health boards or a single health board
-    :param values: (str): The number of cases for the health board(s)
+    :param values: (list or int): The number of cases for the health board(s)
     """
     # Checks if there is a list of health boards or just a single health board
     if type(locations) == list and type(values) == list:
@@ -246,11 +1674,105 @@ def outputData(locations, values):
         for x in range(len(locations)):
             # Take the current items length, remove it from the length of the longest element, add 2 for the clarity
             spacing = ' ' * (len(maxLenElement) - len(locations[x]) + 2)
-            print(locations[x] + spacing + ' | ' + str(values[x]))
-    elif type(locations) == str and type(values) == int:
+            print(locations[x] + spacing + ' | ' + ('*' if values[x] is None else str(values[x])))
+    elif type(locations) == str and values is None:
+        print(locations + '\t|\t*')  # The number was suppressed
+    elif type(locations) == str and type(values) in (int, float):
         print(locations + '\t|\t' + str(values))  # Tab twice to add some space between values
 
 
+def getNameKey(name):
+    """
+    Simplifies a health board name, so names can be matched however they are written
+    e.g. 'NHS Ayrshire & Arran', 'Ayrshire and Arran' and 'ayrshire arran' all become 'ayrshire arran'
+    :param name: (str): The health board name
+    :return: (str): The name in lowercase, without 'NHS', '&', 'and' or punctuation
+    """
+    words = re.sub("[^a-z0-9 ]", " ", name.lower()).split()
+    return ' '.join(word for word in words if word not in ('nhs', 'and'))
+
+
+def buildNameIndex(names):
+    """
+    Builds the lookups used to find a health board from any way of writing its name, once for each set of data
+    :param names: (list): The health board names, as they are in the Excel data
+    :return: (dict): The column number of each name ('columns') and the lookups from a simplified name to the full
+                     name: whole names ('names'), aliases and initials ('aliases'), single words ('words') and the
+                     start of names or words ('prefixes')
+    """
+    index = {'columns': {}, 'names': {}, 'aliases': {}, 'words': {}, 'prefixes': {}}
+    ambiguous = set()  # Prefixes that match more than one health board
+    for col, name in enumerate(names):
+        index['columns'][name] = col + 2  # The health boards start at column 2 in excel
+        key = getNameKey(name)
+        index['names'].setdefault(name.lower(), name)
+        index['names'].setdefault(key, name)
+        words = key.split()
+        if len(words) > 1:
+            index['aliases'].setdefault(''.join(word[0] for word in words), name)  # Initials, e.g. ggc
+        for word in words:
+            index['words'].setdefault(word, name)  # The first health board with the word, as -a has always done
+        for text in [key] + words:
+            for length in range(3, len(text)):
+                prefix = text[:length]
+                if index['prefixes'].get(prefix, name) != name:
+                    ambiguous.add(prefix)
+                index['prefixes'][prefix] = name
+    for prefix in ambiguous:
+        del index['prefixes'][prefix]
+    # Other names for the health boards, only added if that health board is in the data
+    for alias, key in HEALTH_BOARD_ALIASES.items():
+        if key in index['names']:
+            index['aliases'][alias] = index['names'][key]
+    return index
+
+
+def findHealthBoard(location):
+    """
+    Finds the health board that matches the given name, using the name index
+    :param location: (str): The health board name, written in any way, e.g. Glasgow, GGC or NHS Greater Glasgow & Clyde
+    :return: (str): The health board name as it is in the Excel data, or None if it matches no health board
+    """
+    index = getCache()['nameIndex']
+    key = getNameKey(location)
+    for lookup in ('names', 'aliases', 'words', 'prefixes'):
+        if key in index[lookup]:
+            return index[lookup][key]
+    return None
+
+
+def suggestHealthBoards(location):
+    """
+    Finds the health boards with names closest to the given name, for when the name has a typo
+    :param location: (str): The health board name that was given
+    :return: (list): Up to 3 health board names, as they are in the Excel data, closest first
+    """
+    import difflib
+
+    index = getCache()['nameIndex']
+    lookups = dict(index['words'])
+    lookups.update(index['aliases'])
+    lookups.update(index['names'])
+    suggestions = []
+    for match in difflib.get_close_matches(getNameKey(location), list(lookups), n=6, cutoff=0.6):
+        if lookups[match] not in suggestions:
+            suggestions.append(lookups[match])
+    return suggestions[:3]
+
+
+def getInvalidNameMessage(location):
+    """
+    Makes the error shown when a health board name does not match any of the health boards
+    :param location: (str): The health board name that was given
+    :return: (str): The error message, with the closest health board names if there are any
+    """
+    suggestions = suggestHealthBoards(location) if location.strip() else []
+    if len(suggestions) == 0:
+        return invalidNameMessage
+    return invalidNameMessage.replace('\nEnding program', '\nDid you mean: ' + ', '.join(suggestions) +
+                                      '?\nEnding program')
+
+
 def getHealthBoardFullName(location):
     """
     Takes user inputted health board name, converting it into the name as it appears in the covid data excel sheet
@@ -258,28 +1780,10 @@ def getHealthBoardFullName(location):
     :param location: (str): The health board name that
     :return: (str): The official name of the health board
     """
-    valid = True
-    healthBoardNameFull = ''  # Stores the health board name
-    if valid:
-        locationsList = getHealthBoardList()
-        for x in range(len(locationsList)):  # Loops the entire list of health boards
-            splitLocation = locationsList[x].split()
-            for y in range(len(splitLocation)):
-                if location.lower() == splitLocation[y].lower():
-                    healthBoardNameFull = locationsList[x]
-                    break
-            if healthBoardNameFull != '':  # Escapes the FOR loop, as there is now a health board name
-                break
-            # if location.lower() in locationsList[x].lower():  # If the given finds a match in the list of locations
-            #     healthBoardNameFull = locationsList[x]  # Store that full health board name in a variable
-            #     break
-    if healthBoardNameFull == '':  # If there is no match, print error, print valid names and end
-        print('Error - Invalid name given, please enter a name that matches one of the following:')
-        print(healthBoards)  # Prints the health board names
-        print('Ending program')
-        sys.exit()  # Uses the sys package to end the program, as no valid name given
-    elif healthBoardNameFull in locationsList:  # If there is a matching name in the location list, return as String
-        return healthBoardNameFull
+    healthBoardNameFull = findHealthBoard(location)
+    if healthBoardNameFull is None:  # If there is no match, show an error with the valid names
+        raise QueryError(getInvalidNameMessage(location))
+    return healthBoardNameFull
 
 
 def handleInput(theArea):
@@ -288,16 +1792,568 @@ def handleInput(theArea):
     :param theArea: The command line arguments passed
     :return: The Health board name, that matches the same name in hte Excel data
     """
-    areaName = ''
+    # Checks the whole name first, e.g. Greater Glasgow, then each part, skipping NHS and &, e.g. Glasgow
+    areaName = findHealthBoard(' '.join(theArea))
     for namePart in theArea:
-        if len(areaName) < 1:
-            if namePart != "&" and namePart != "NHS":
-                for x in getHealthBoardList():
-                    if namePart in x and namePart != "&" and namePart != "NHS":
-                        areaName = getHealthBoardFullName(str(namePart))
-                        return areaName
+        if areaName is not None:
+            break
+        if namePart != "&" and namePart != "NHS":
+            areaName = findHealthBoard(namePart)
+    if areaName is None:
+        raise QueryError(getInvalidNameMessage(' '.join(theArea)))
+    return areaName
+
+
+def getLocalData(offline=False):
+    """
+    Checks the website for the newest covid data, downloading it if there is no local copy and removing older files
+    :param offline: (bool): If True, the website is not used and the newest downloaded file is used instead
+    :return: (str): The path of the newest Excel file
+    """
+    from send2trash import send2trash
+
+    if offline:
+        # The manifest is replaced in one step, so it can be read without waiting for a run that is downloading
+        return os.path.join('ExcelFiles', getOfflineFileName())
+
+    # Checks if their is a suitable directory to store the Excel files, if not, makes one
+    os.makedirs('ExcelFiles', exist_ok=True)
+    # Only one run at a time checks the website and downloads, any others wait for it to finish, then find the newest
+    # file is already downloaded instead of downloading it again. The download lock is separate from the directory's
+    # lock, so runs reading the data already downloaded do not wait for the website.
+    with lockDirectory('ExcelFiles', lockName=DOWNLOAD_LOCK_FILE):
+        manifest = readManifest()
+        newestFile = getNewestFileName()  # Stores the expected file name from the website
+        newestPath = os.path.join('ExcelFiles', newestFile)
+        today = getFormattedDate()  # Gets the date in a URL format to add to the source file URL
+        fileURL = "http://www.gov.scot/binaries/content/documents/govscot/publications/statistics/2020/04/" \
+                  "coronavirus-covid-19-trends-in-daily-data/documents/covid-19-data-by-nhs-board/covid-19-data-by-" \
+                  "nhs-board/govscot%3Adocument/COVID-19%2Bdaily%2Bdata%2B-%2Bby%2BNHS%2BBoard%2B-%2B" + today + \
+                  ".xlsx?forceDownload=true "
+
+        # A file with the most recent data does not already exist
+        if newestFile not in manifest['files'] or not os.path.exists(newestPath):
+            print('Local covid data is out of date - Downloading recent data.', file=statusOutput)
+            with phaseTimer('downloadData') as phase:
+                # A file listed before, e.g. one removed by hand, has to match the size and hash it had then
+                known = manifest['files'].get(newestFile, {})
+                # Downloads newest file is available or uses older file. It is saved as a .part file until it is
+                # complete, so it does not need the directory's lock
+                download = downloadData(fileURL, newestFile, known.get('size'), known.get('sha256'))
+                if download is not None:
+                    phase['bytes'] = download['bytes']
+                # Records the file's size and hash, so it can be checked against later
+                manifest['files'][newestFile] = {'size': os.path.getsize(newestPath),
+                                                 'sha256': None if download is None else download['sha256']}
+        if manifest['newestFile'] != newestFile:
+            # Runs that chose the file that was the newest may not have loaded it yet, so it is kept until the next
+            # newer file replaces this one
+            manifest['previousFile'] = manifest['newestFile']
+        manifest['newestFile'] = newestFile
+        keptFiles = {newestFile, manifest.get('previousFile')}
+
+        # Only the snapshots, removing older files and the manifest change the files other runs read, so the
+        # directory is only locked for those
+        with lockDirectory('ExcelFiles'):
+            # File management - Stores every Excel file in the snapshot store, so older data can still be queried,
+            # then clears out any older Excel files
+            with phaseTimer('addSnapshots'):
+                for theFile in sorted(manifest['files'], key=lambda name: getPublishDate(name) or date.min):
+                    published = getPublishDate(theFile)
+                    if published is not None and os.path.exists(os.path.join('ExcelFiles', theFile)):
+                        addSnapshot(os.path.join('ExcelFiles', theFile), published)
+            with phaseTimer('cleanUp'):
+                # Keeps the cache of the older file until the newest file's cache is built, so only new rows are read
+                base = None
+                if not os.path.exists(getCachePath(newestPath)):
+                    base = findBaseCache(newestPath)
+                for theFile in [theFile for theFile in manifest['files'] if theFile not in keptFiles]:
+                    path = os.path.join('ExcelFiles', theFile)
+                    for oldPath in (path, path + PARTIAL_EXT, path + PARTIAL_EXT + PARTIAL_DETAILS_EXT,
+                                    getCachePath(path)):
+                        if os.path.exists(oldPath) and (base is None or oldPath != base['path']):
+                            send2trash(os.path.abspath(oldPath))
+                    if not os.path.exists(getCachePath(path)):
+                        del manifest['files'][theFile]  # Listed until its cache is removed too
+            saveManifest(manifest)
+    return newestPath
+
+
+def runQuery(args):
+    """
+    Answers the query given by the command line arguments, using the loaded covid data
+    :param args: (argparse.Namespace): The parsed command line arguments
+    :return: (tuple): A message about the results, the health board name(s) and the number(s) of cases.
+                      None if the arguments have no query
+    """
+    if args.new is True:
+        # Returns the newest case numbers, 1 only shows the cases added since yesterdays data
+        values = getHealthBoardPeriod(1, 'all')
+        return 'Getting all health boards cases over 1 days', getHealthBoardList(), values
+    elif args.scotland is True:
+        total = getScotlandTotal()  # Checked first, so a table without Scotland gets its own error
+        return 'Scotlands total cases', getHealthBoardFullName('Scotland'), total
+    elif args.area is not None:
+        area = handleInput(args.area)
+        if area not in getHealthBoardList():
+            raise QueryError(invalidNameMessage)
+        return area + 's total cases', area, getHealthBoardTotal(area)
+    elif args.cases is not None:
+        # Takes the given area, converts to Excel formatted health board name and checks the the cases for the given days
+        if len(args.cases) < 2:
+            raise QueryError('Error: Missing the health board name argument\n-c requires a number for days (e.g. 1, 7, '
+                             '2) and a Health Board name or all')
+        if args.cases[1] != 'all':
+            area = handleInput(args.cases[1:])
+            if area not in getHealthBoardList():
+                raise QueryError(invalidNameMessage)
+            values = getHealthBoardPeriod(args.cases[0], area)
+            return 'Getting the last ' + str(int(args.cases[0])) + ' days of cases for ' + area, area, values
+        values = getHealthBoardPeriod(args.cases[0], 'all')
+        return 'Getting all health boards cases over ' + str(int(args.cases[0])) + ' days', getHealthBoardList(), values
+    elif args.total is True:
+        # Returns all health boards and all of the total case numbers
+        return 'Every health boards total case numbers', getHealthBoardList(), getNewest()
+    elif args.range is not None:
+        # Takes an optional health board name, and the --from and --to dates, returning the cases between those dates
+        area = getQueryArea(args.range)
+        values = getHealthBoardRange(args.fromDate, args.toDate, area)
+        period = ' from ' + getQueryDate(args.fromDate, 0) + ' to ' + getQueryDate(args.toDate, -1)
+        if area == 'all':
+            return 'Getting all health boards cases' + period, getHealthBoardList(), values
+        return 'Getting the cases for ' + area + period, area, values
+    elif args.average is not None:
+        # Takes a number of days and a health board name or all, returning the rolling average up to the --to date
+        if len(args.average) < 2:
+            raise QueryError('Error: Missing the health board name argument\n-ra requires a number for days (e.g. '
+                             '7, 14, 28) and a Health Board name or all')
+        area = getQueryArea(args.average[1:])
+        values = getHealthBoardAverage(args.average[0], args.toDate, area)
+        message = 'Getting the ' + args.average[0] + ' day average of daily cases for '
+        if area == 'all':
+            return message + 'all health boards, up to ' + getQueryDate(args.toDate, -1), getHealthBoardList(), values
+        return message + area + ', up to ' + getQueryDate(args.toDate, -1), area, values
+    elif args.healthboards is True:
+        return 'The following Health Boards can be used as arguments:', healthBoards, None
+    return None
+
+
+def getQueryArea(nameParts):
+    """
+    Takes the health board name arguments, returning the name of the health board as it is in the Excel data
+    :param nameParts: (list): The health board name arguments, e.g. ['Greater', 'Glasgow'], or ['all']
+    :return: (str): The health board name, or 'all' if no name or all is given
+    """
+    if len(nameParts) == 0 or nameParts == ['all']:
+        return 'all'
+    area = handleInput(nameParts)
+    if area not in getHealthBoardList():
+        raise QueryError(invalidNameMessage)
+    return area
+
+
+def getQueryDate(day, row):
+    """
+    Formats a date given as an argument, for showing with the query results
+    :param day: (datetime.date): The date given as an argument, or None if it was not given
+    :param row: (int): The position of the row of data to use the date of, if no date was given
+    :return: (str): The date in YYYY-MM-DD format
+    """
+    if day is None:
+        day = date.fromordinal(int(getCache()['dates'][row]))
+    return day.isoformat()
+
+
+def readDate(text):
+    """
+    Reads a date argument, used by argparse to check the --from and --to dates
+    :param text: (str): The date in YYYY-MM-DD format
+    :return: (datetime.date): The date
+    """
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError('dates must be in YYYY-MM-DD format, e.g. 2020-10-25')
+
+
+def formatResults(locations, values):
+    """
+    Formats the results of a query, to be output as JSON or CSV
+    :param locations: (list or str): A list of all health boards or a single health board
+    :param values: (list or int): The number of cases for the health board(s), None for -hb or a suppressed number
+    :return: (list): The results, a dict with the health board name and number of cases for each health board.
+                     Just the list of health board names for -hb
+    """
+    if values is None and type(locations) == list:
+        return locations
+    elif type(locations) == list:
+        return [{'healthBoard': location, 'cases': value} for location, value in zip(locations, values)]
+    return [{'healthBoard': locations, 'cases': values}]
+
+
+def runBatch(batchFile, outputFormat):
+    """
+    Answers a list of queries, one per line, using the same arguments as the command line, e.g. -c 7 all
+    The covid data is only loaded once, and the results of every query are output together as JSON or CSV
+    :param batchFile: (str): The path of the file with the queries, or - to read them from stdin
+    :param outputFormat: (str): json or csv
+    """
+    import csv
+    import shlex
+
+    if batchFile == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(batchFile) as queryFile:
+            lines = queryFile.readlines()
+
+    answers = []
+    for line in lines:
+        line = line.strip()
+        if line == '' or line.startswith('#'):
+            continue  # Skips blank lines and comments
+        answer = {'query': line}
+        try:
+            queryArgs = parser.parse_args(shlex.split(line))
+            if queryArgs.batch is not None or queryArgs.serve is not None:
+                raise QueryError('Error: --batch and --serve can not be used in a batch of queries')
+            if queryArgs.asOf is not None or queryArgs.file is not None or queryArgs.table is not None or \
+                    queryArgs.export is not None:
+                # The data is loaded once for the whole batch, so these have to be given with -b instead
+                raise QueryError('Error: --as-of, -f, --table and --export can not be used in a batch of queries, '
+                                 '--as-of, -f and --table can be given with -b to use them for every query')
+            result = runQuery(queryArgs)
+            if result is None:
+                raise QueryError('Error: No query given')
+            answer['message'] = result[0]
+            answer['results'] = formatResults(result[1], result[2])
+        except QueryError as error:
+            answer['error'] = str(error)
+        except (SystemExit, ValueError):
+            # argparse ends the program when it can not read the arguments, shlex gives a ValueError for bad quotes
+            answer['error'] = 'Invalid query arguments: ' + line
+        answers.append(answer)
+
+    if outputFormat == 'csv':
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(['query', 'healthBoard', 'cases', 'error'])
+        for answer in answers:
+            if 'error' in answer:
+                writer.writerow([answer['query'], '', '', answer['error']])
+                continue
+            for result in answer['results']:
+                if type(result) == dict:
+                    writer.writerow([answer['query'], result['healthBoard'], result['cases'], ''])
+                else:
+                    writer.writerow([answer['query'], result, '', ''])  # A health board name from -hb
+    else:
+        json.dump(answers, sys.stdout, indent=2)
+        print()
+
+
+def getExportFormat(path, outputFormat):
+    """
+    Finds the format to export to, from --format or the file extension
+    :param path: (str): The path of the file to export to, or - for stdout
+    :param outputFormat: (str): The format given with --format, or None
+    :return: (str): csv, jsonl, parquet or arrow
+    """
+    if outputFormat is None:
+        outputFormat = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if outputFormat not in EXPORT_FORMATS.values():
+        raise QueryError('ERROR: Can not export to ' + path + ', please use a .csv, .jsonl, .parquet or .arrow file, '
+                         'or --format csv, jsonl, parquet or arrow')
+    if path == '-' and outputFormat in ('parquet', 'arrow'):
+        raise QueryError('ERROR: Parquet and Arrow files can not be written to stdout, please give a file name')
+    return outputFormat
+
+
+def getTableBatches(dates, cases):
+    """
+    Splits the whole table of covid data into batches of rows, so they can be exported without converting it all
+    :param dates: (numpy.ndarray): The dates as day numbers
+    :param cases: (numpy.ndarray): The case numbers as a 2D array of health boards by dates
+    :return: (generator): The columns of each batch of EXPORT_BATCH_ROWS rows, the dates then each health board
+    """
+    for start in range(0, len(dates), EXPORT_BATCH_ROWS):
+        yield [dates[start:start + EXPORT_BATCH_ROWS]] + list(cases[:, start:start + EXPORT_BATCH_ROWS])
+
+
+def toArrowColumn(column, kind):
+    """
+    Converts a column of a batch into an Arrow array
+    :param column: (numpy.ndarray or list): The values
+    :param kind: (str): date for day numbers, text, number for whole numbers or decimal
+    :return: (pyarrow.Array): The values, with MISSING numbers as nulls
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    if kind == 'date':
+        # Arrow dates are the number of days since 1970-01-01
+        return pa.array(np.asarray(column, dtype='<i8') - date(1970, 1, 1).toordinal(), pa.int32()).cast(pa.date32())
+    elif kind == 'number':
+        column = np.asarray(column, dtype='<i8')
+        return pa.array(column, pa.int64(), mask=column == MISSING)
+    elif kind == 'decimal':
+        return pa.array(np.asarray(column, dtype='<f8'), pa.float64())
+    return pa.array(column, pa.string())
+
+
+def toPythonRows(columns, batch):
+    """
+    Converts a batch of columns into rows of Python values, for CSV and JSON Lines
+    :param columns: (list): The name and kind of each column, as for writeExport()
+    :param batch: (list): The values of each column in the batch
+    :return: (zip): The values of each row, with dates as YYYY-MM-DD and MISSING numbers as None
+    """
+    values = []
+    for (_, kind), column in zip(columns, batch):
+        column = column.tolist() if hasattr(column, 'tolist') else column
+        if kind == 'date':
+            column = [date.fromordinal(day).isoformat() for day in column]
+        elif kind == 'number':
+            column = [None if value == MISSING else value for value in column]
+        values.append(column)
+    return zip(*values)
+
+
+def writeExport(path, exportFormat, columns, batches):
+    """
+    Writes batches of rows to a file, one batch at a time, so the whole export is never held in memory
+    The file is written under a temporary name then renamed, so a stopped export never leaves a partial file
+    :param path: (str): The path of the file, or - for stdout (CSV and JSON Lines only)
+    :param exportFormat: (str): csv, jsonl, parquet or arrow
+    :param columns: (list): The name and kind of each column, where the kind is date, text, number or decimal
+    :param batches: (iterable): The batches of rows, each a list of the values of each column
+    :return: (int): The number of rows written
+    """
+    import csv
+
+    rows = 0
+    names = [name for name, _ in columns]
+    tempPath = path + '.tmp'
+    if exportFormat in ('parquet', 'arrow'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise QueryError('ERROR: Exporting to Parquet or Arrow needs pyarrow, install it with: pip install pyarrow')
+        kinds = {'date': pa.date32(), 'text': pa.string(), 'number': pa.int64(), 'decimal': pa.float64()}
+        schema = pa.schema([(name, kinds[kind]) for name, kind in columns])
+        # Each batch is written as a Parquet row group, or an Arrow record batch
+        if exportFormat == 'parquet':
+            writer = pq.ParquetWriter(tempPath, schema)
+            writeBatch = writer.write_table
+            makeBatch = pa.Table.from_arrays
         else:
-            return areaName
+            writer = pa.ipc.new_file(tempPath, schema)
+            writeBatch = writer.write_batch
+            makeBatch = pa.RecordBatch.from_arrays
+        with writer:
+            for batch in batches:
+                writeBatch(makeBatch([toArrowColumn(column, kind) for (_, kind), column in zip(columns, batch)],
+                                     schema=schema))
+                rows += len(batch[0])
+    else:
+        exportFile = sys.stdout if path == '-' else open(tempPath, 'w', newline='')
+        try:
+            if exportFormat == 'csv':
+                writer = csv.writer(exportFile, lineterminator='\n')
+                writer.writerow(names)
+            for batch in batches:
+                for row in toPythonRows(columns, batch):
+                    if exportFormat == 'csv':
+                        writer.writerow(row)
+                    else:
+                        exportFile.write(json.dumps(dict(zip(names, row))) + '\n')
+                rows += len(batch[0])
+            exportFile.flush()  # So a closed stdout is found here, rather than when Python exits
+        except BrokenPipeError:
+            if exportFile is not sys.stdout:
+                raise
+            # Whatever was reading stdout has stopped, e.g. head, so stop quietly. stdout is pointed at devnull, as
+            # Python flushes it again when it exits, which would fail the same way
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            sys.exit()
+        finally:
+            if exportFile is not sys.stdout:
+                exportFile.close()
+    if path != '-':
+        os.replace(tempPath, path)
+    return rows
+
+
+def exportData(path, outputFormat, result):
+    """
+    Exports the results of a query, or the whole table of covid data if there is no query, to a file
+    The whole table has a row for each date and a column for each health board, with the numbers as they are in the
+    Excel file, so numbers that were not published (*) are left empty
+    :param path: (str): The path of the file, or - for stdout
+    :param outputFormat: (str): The format given with --format, or None to use the file extension
+    :param result: (tuple): The results of the query, as returned by runQuery(), or None for the whole table
+    :return: (int): The number of rows written
+    """
+    exportFormat = getExportFormat(path, outputFormat)
+    if result is None:
+        columns = [('date', 'date')] + [(name, 'number') for name in getCache()['names']]
+        return writeExport(path, exportFormat, columns, getTableBatches(getCache()['dates'], getCache()['cases']))
+
+    locations, values = result[1], result[2]
+    if type(locations) != list:
+        locations, values = [locations], [values]  # A single health board, e.g. from -a
+    if values is None:
+        return writeExport(path, exportFormat, [('healthBoard', 'text')], [[locations]])  # The names from -hb
+    kind = 'decimal' if any(type(value) == float for value in values) else 'number'
+    values = [MISSING if value is None else value for value in values]  # Suppressed numbers, written as empty
+    return writeExport(path, exportFormat, [('healthBoard', 'text'), ('cases', kind)], [[locations, values]])
+
+
+def getServerArguments(path, params):
+    """
+    Converts a request to the server into the command line arguments for the same query
+    :param path: (str): The path of the request, e.g. /cases
+    :param params: (dict): The query string parameters of the request, e.g. {'days': ['7'], 'area': ['all']}
+    :return: (list): The command line arguments, or None if the path is not a query
+    """
+    # Each parameter is passed to argparse, so one starting with - would be read as another argument, e.g. --table
+    for values in params.values():
+        for value in values:
+            if any(word.startswith('-') for word in value.split()):
+                raise QueryError('ERROR: Query parameters can not start with -, given: ' + value)
+    name = ' '.join(params.get('name', params.get('area', ['all']))).split()
+    if path == '/new':
+        return ['-n']
+    elif path == '/scotland':
+        return ['-s']
+    elif path == '/area':
+        return ['-a'] + name
+    elif path == '/cases':
+        return ['-c', params.get('days', ['1'])[0]] + name
+    elif path == '/total':
+        return ['-t']
+    elif path == '/healthboards':
+        return ['-hb']
+
+    # Queries that can take the --from and --to dates
+    dates = []
+    for param, argument in (('from', '--from'), ('to', '--to')):
+        if param in params:
+            dates += [argument, params[param][0]]
+    if path == '/range':
+        return ['-r'] + name + dates
+    elif path == '/average':
+        return ['-ra', params.get('days', ['7'])[0]] + name + dates
+    return None
+
+
+def createQueryHandler():
+    """
+    Creates the class that handles the server's requests, so http.server is only imported when the server is run
+    :return: (type): The request handler class, for http.server
+    """
+    import urllib.parse
+    from http.server import BaseHTTPRequestHandler
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        """
+        Answers HTTP GET requests with the results of the matching query, as JSON
+        e.g. /cases?days=7&area=all gives the same results as -c 7 all
+        """
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path == '/timings':
+                self.sendJSON(200, getTimings())
+                return
+            try:
+                queryArgs = getServerArguments(url.path, urllib.parse.parse_qs(url.query))
+            except QueryError as error:
+                self.sendJSON(400, {'error': str(error)})
+                return
+            if queryArgs is None:
+                self.sendJSON(404, {'error': 'Unknown query: ' + url.path})
+                return
+            with dataLock:
+                # The query uses the data it started with, even if newer data is swapped in part way through, so
+                # queries only hold the lock long enough to take the data and can be answered at the same time
+                queryData.cache = cache
+            try:
+                with phaseTimer('query'):
+                    message, locations, values = runQuery(parser.parse_args(queryArgs))
+                    latestDate = date.fromordinal(int(getCache()['dates'][-1])).isoformat()
+            except QueryError as error:
+                self.sendJSON(400, {'error': str(error)})
+                return
+            except SystemExit:
+                # argparse ends the program when it can not read the arguments
+                self.sendJSON(400, {'error': 'Invalid query arguments: ' + ' '.join(queryArgs)})
+                return
+            finally:
+                del queryData.cache  # So the thread does not keep older data in memory
+
+            results = formatResults(locations, values)
+            self.sendJSON(200, {'message': message, 'date': latestDate, 'results': results})
+
+        def sendJSON(self, status, body):
+            """
+            Sends the response to the request
+            :param status: (int): The HTTP status code
+            :param body: (dict): The response, which is sent as JSON
+            """
+            content = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+    return QueryHandler
+
+
+def reloadData(path, localFile, offline, table):
+    """
+    Checks for newer covid data every RELOAD_INTERVAL seconds, swapping it in for the data used by the server
+    :param path: (str): The path of the Excel file currently loaded
+    :param localFile: (bool): True if the data is from a file given with -f, so only that file is checked for changes
+    :param offline: (bool): True if the newest downloaded file should be used, without checking the website
+    :param table: (str): Part of the title of the table to load, or None for the cumulative cases table
+    """
+    global cache
+    while True:
+        time.sleep(RELOAD_INTERVAL)
+        try:
+            newPath = path if localFile else getLocalData(offline)
+            if newPath != path or getSourceStamp(newPath) != cache['source']:
+                newData = loadData(newPath, table)  # Loaded before taking the lock, so queries are not held up
+                with dataLock:
+                    cache = newData
+                path = newPath
+                print('Loaded newer covid data from ' + path)
+        except (Exception, SystemExit) as error:
+            # Keep using the current data, the next check may work
+            print('Error! Could not check for newer covid data: ' + str(error))
+
+
+def serveQueries(port, path, localFile, offline, table):
+    """
+    Runs a HTTP server that answers queries as JSON, keeping the covid data loaded between requests
+    :param port: (int): The port number to listen on
+    :param path: (str): The path of the Excel file currently loaded
+    :param localFile: (bool): True if the data is from a file given with -f, so it is not downloaded from the website
+    :param offline: (bool): True if the newest downloaded file should be used, without checking the website
+    :param table: (str): Part of the title of the table to load, or None for the cumulative cases table
+    """
+    from http.server import ThreadingHTTPServer
+
+    threading.Thread(target=reloadData, args=(path, localFile, offline, table), daemon=True).start()
+    server = ThreadingHTTPServer(('127.0.0.1', port), createQueryHandler())
+    print('Answering queries on http://127.0.0.1:' + str(port) + '/ - Press Ctrl+C to stop')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 
 # argparse variables
@@ -321,112 +2377,221 @@ group.add_argument('-t', '--total', required=False, action='store_true',
                    help="Returns all health boards total case numbers")
 group.add_argument('-hb', '--healthboards', required=False, action='store_true',
                    help="Returns all health boards available")
-args = parser.parse_args()
-
-newestFile = formatFileName()  # Stores the expected file name from the website
-today = getFormattedDate()  # Gets the date in a URL format to add to the source file URL
-fileURL = "http://www.gov.scot/binaries/content/documents/govscot/publications/statistics/2020/04/coronavirus" \
-          "-covid-19-trends-in-daily-data/documents/covid-19-data-by-nhs-board/covid-19-data-by-nhs-board/govscot" \
-          "%3Adocument/COVID-19%2Bdaily%2Bdata%2B-%2Bby%2BNHS%2BBoard%2B-%2B" + today + ".xlsx?forceDownload=true "
-
-healthBoards = ['Ayrshire Arran', 'Borders', 'Dumfries Galloway', 'Fife', 'Forth Valley', 'Grampian', 'Greater Glasgow Clyde', 'Highland', 'Lanarkshire', 'Lothian', 'Orkney', 'Shetland', 'Tayside', 'Western Isles', 'Scotland']
+group.add_argument('-r', '--range', required=False, nargs='*', help="Takes a health board or \'all\', returns the "
+                                                                  "case numbers between the --from and --to dates",
+                   metavar='HEALTHBOARD')
+group.add_argument('-ra', '--average', required=False, nargs='*', help="Takes a number of days (7, 14 or 28) & a "
+                                                                       "health board or \'all\', returns the rolling "
+                                                                       "average of daily cases up to the --to date",
+                   metavar=('DAYS', 'HEALTHBOARD'))
+group.add_argument('-b', '--batch', required=False, help="Takes a file of queries, one per line using the above "
+                                                        "arguments (e.g. -c 7 all), or - to read them from stdin, "
+                                                        "returns all of the results together", metavar='FILE')
+group.add_argument('--revisions', required=False, nargs=2, type=readDate, help="Takes two dates the data was "
+                                                                               "published, in YYYY-MM-DD format, "
+                                                                               "returns the case numbers that were "
+                                                                               "changed between them",
+                   metavar=('OLDER', 'NEWER'))
+group.add_argument('--tables', required=False, action='store_true', help="Returns the tables of data that can be "
+                                                                          "used with --table")
+group.add_argument('--serve', required=False, type=int, help="Runs a local server on the given port, that answers "
+                                                             "the above queries as JSON", metavar='PORT')
+parser.add_argument('-f', '--file', required=False, help="Uses the given Excel file, instead of downloading the "
+                                                         "newest file from the website", metavar='FILE')
+parser.add_argument('--table', required=False, help="Answers the query using the table whose title contains the "
+                                                     "given text, e.g. ICU (default: the cumulative cases table)",
+                    metavar='NAME')
+parser.add_argument('--from', required=False, type=readDate, dest='fromDate', help="The first date for -r, in "
+                                                                                  "YYYY-MM-DD format (default: the "
+                                                                                  "first date in the data)",
+                    metavar='DATE')
+parser.add_argument('--to', required=False, type=readDate, dest='toDate', help="The last date for -r and -ra, in "
+                                                                               "YYYY-MM-DD format (default: the "
+                                                                               "newest date in the data)",
+                    metavar='DATE')
+parser.add_argument('--format', required=False, choices=['json', 'csv', 'jsonl', 'parquet', 'arrow'],
+                    help="The output format for -b, json or csv (default: json), or for --export, csv, jsonl, "
+                         "parquet or arrow (default: from the file extension)")
+parser.add_argument('--export', required=False, help="Saves the results of the query to the given file instead of "
+                                                     "outputting them, or the whole table of data if there is no "
+                                                     "query, or - for stdout", metavar='FILE')
+parser.add_argument('--as-of', required=False, type=readDate, dest='asOf', help="Answers the query using the data "
+                                                                                "as it was published on the given "
+                                                                                "date, in YYYY-MM-DD format",
+                    metavar='DATE')
+parser.add_argument('--timings', required=False, action='store_true', help="Outputs the time and bytes transferred "
+                                                                             "of each step of the program, after the "
+                                                                             "results")
+parser.add_argument('--trace', required=False, help="Saves the timings of each step of the program to the given file, "
+                                                    "as JSON", metavar='FILE')
+parser.add_argument('--memory', required=False, action='store_true', help="Adds the peak memory of each step to "
+                                                                            "--timings, --trace and the server's "
+                                                                            "/timings, which slows the program down")
+parser.add_argument('--profile', required=False, help="Profiles the program with cProfile, saving the results to the "
+                                                      "given file", metavar='FILE')
+parser.add_argument('--offline', required=False, action='store_true', help="Uses the newest downloaded data, "
+                                                                             "without checking the website")
 
-if platform.system() == "Windows":
-    excelDir = "\\ExcelFiles\\"
-else:
-    excelDir = '/ExcelFiles/'
-
-# Checks if their is a suitable directory to store the Excel files, if not, makes one
-if 'ExcelFiles' not in os.listdir(os.getcwd()):
-    os.mkdir(os.getcwd() + excelDir)
-# A file with the most recent data does not already exist
-if newestFile not in os.listdir(os.getcwd() + excelDir):
-    print('Local covid data is out of date - Downloading recent data.')
-    downloadData(fileURL, newestFile)  # Downloads newest file is available or uses older file
-    urllib.request.urlcleanup()
-
-# File management - Clear out any older Excel files
-count = 0
-for theFile in os.listdir(os.getcwd() + excelDir):
-    if theFile != newestFile:
-        count += 1
-        send2trash(os.getcwd() + excelDir + theFile)
-
-# Loads the most recent excel file, data_only used to ignore any formulas, as we only need the actual values
-if platform.system() == "Windows":
-    excel = load_workbook('ExcelFiles//' + newestFile, data_only=True)
-else:
-    excel = load_workbook('ExcelFiles/' + newestFile, data_only=True)
-
-# Get the correct sheet from the Excel file
-# for theSheet in range(len(excel.sheetnames)):
-#     if excel.sheetnames[theSheet] == 'Table 1 - Cumulative cases':
-#         excel.active = theSheet  # The active sheet is used to access the sheets data
-# sheet = excel.active
-sheet = excel.worksheets[2]
-
-# Sometimes the sheet comes back with the last row, as the one after the last line of actual data
-# So, instead of using sheet.max_row, loop from the last row, until the first row of actual data, store that row number
-lastEmptyRow = sheet.max_row
-while sheet.cell(row=lastEmptyRow, column=1).value is None:
-    lastEmptyRow -= 1
-lastRowNum = lastEmptyRow
+cache = None  # The loaded covid data, as returned by loadData(), only loaded when a query needs it
+statusOutput = None  # Where messages about downloads and errors go, None for stdout, or stderr when stdout has the data
+phaseTimings = collections.deque(maxlen=TIMINGS_KEPT)  # The timings of the most recent steps, from phaseTimer()
+phaseTotals = {}  # The total time, bytes and peak memory of each step, from phaseTimer()
+timingsLock = threading.Lock()  # Held while the timings are being updated or read
+dataLock = threading.Lock()  # Held while the server swaps in newer data, or a query takes the data to use
+queryData = threading.local()  # The covid data each of the server's threads is answering its query with
 
 # A message to display during certain CLI arguments
 intro = '\n---- Scottish Covid Case Checker ---- \nAnalyses Scottish Covid-19 cases and returns specific case numbers\n'
 
-# CLI Input handler
-# Uses argparse arguments to run a specific function
-if args.new is True:
-    # Returns the newest case numbers, 1 only shows the cases added since yesterdays data
-    print(intro)
-    outputData(getHealthBoardList(), getHealthBoardPeriod(1, 'all'))
-elif args.scotland is True:
-    print(intro)
-    print('Scotlands total cases')
-    outputData(getHealthBoardFullName('Scotland'), getScotlandTotal())
-elif args.area is not None:
-    print(intro)
-    area = handleInput(args.area)
-    if area in getHealthBoardList():
-        print(area + 's total cases')
-        outputData(area, getHealthBoardTotal(area))
-    else:
-        print('Error - Invalid name given, please enter a name that matches one of the following:')
-        print(healthBoards)  # Prints the health board names
-        print('Ending program')
-    sys.exit()
-elif args.cases is not None:
-    # Takes the given area, converts to Excel formatted health board name and checks the the cases for the given days
-    print(intro)
+
+def needsData(args):
+    """
+    Checks if the given arguments need the covid data, -h and -hb are answered without it
+    :param args: (argparse.Namespace): The parsed command line arguments
+    :return: (bool): True if the covid data has to be loaded
+    """
+    return args.new or args.scotland or args.area is not None or args.cases is not None or args.total or \
+        args.range is not None or args.average is not None or args.batch is not None or args.serve is not None or \
+        args.revisions is not None or args.tables or args.export is not None
+
+
+def main():
+    """
+    Reads the command line arguments and runs the program, recording its timings or profile if asked to
+    """
+    global statusOutput
+
+    args = parser.parse_args()
+    if args.asOf is not None and args.serve is not None:
+        parser.error('--as-of can not be used with --serve')
+    if args.asOf is not None and args.table is not None:
+        parser.error('--as-of can only be used with the cumulative cases table, not --table')
+    if args.export is not None and (args.serve is not None or args.batch is not None or args.tables or
+                                    args.revisions is not None):
+        parser.error('--export can only be used with a query, or on its own to export the whole table')
+    if args.batch is not None and args.format not in (None, 'json', 'csv'):
+        parser.error('-b can only output json or csv')
+    if args.memory and not (args.timings or args.trace is not None or args.serve is not None):
+        parser.error('--memory can only be used with --timings, --trace or --serve')
+
+    if args.batch is not None or args.export == '-':
+        statusOutput = sys.stderr  # Keeps the JSON, CSV or JSON Lines written to stdout valid
+    if args.memory:
+        # Records the peak memory of each step. Every allocation is traced, which slows the program down, so the
+        # times are only the program's own when this is not used
+        tracemalloc.start()
+    profiler = None
+    if args.profile is not None:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
     try:
-        if args.cases[1] != 'all':
-            onlyArea = args.cases[1:]
-            area = handleInput(onlyArea)
-            if area in getHealthBoardList():
-                outputData(area, getHealthBoardPeriod(args.cases[0], area))
-            else:
-                print('Error - Invalid name given, please enter a name that matches one of the following:')
-                print(healthBoards)  # Prints the health board names
-                print('Ending program')
+        runCommand(args)
+    finally:
+        # Runs even if the program ends early, e.g. from an invalid health board name
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if args.trace is not None:
+            with open(args.trace, 'w') as traceFile:
+                json.dump(getTimings(), traceFile, indent=2)
+        if args.timings:
+            outputTimings()
+
+
+def runCommand(args):
+    """
+    Loads the covid data if it is needed and outputs the results for the command line arguments
+    :param args: (argparse.Namespace): The parsed command line arguments
+    """
+    global cache
+
+    # Loads the covid data, from the given file or the newest file from the website
+    if needsData(args):
+        with phaseTimer('imports'):
+            # Imported here, rather than where they are first used, so the time taken to import them is not added to
+            # the first step that uses them. The modules are not used here, so they are only loaded into Python's
+            # module cache, where the imports inside the functions find them
+            importlib.import_module('numpy')
+            if args.file is None and not args.offline:
+                importlib.import_module('requests')
+        if args.file is not None:
+            dataPath = args.file
         else:
-            area = 'all'
-            outputData(getHealthBoardList(), getHealthBoardPeriod(args.cases[0], 'all'))
-    except IndexError as e:
-        print('Error: Missing the health board name argument')
-        print('-c requires a number for days (e.g. 1, 7, 2) and a Health Board name or all')
-elif args.total is True:
-    # Prints all health boards and all of the total case numbers
-    print(intro)
-    print('Every health boards total case numbers')
-    outputData(getHealthBoardList(), getNewest())
-elif args.healthboards is True:
-    print(intro)
-    print('The following Health Boards can be used as arguments:')
-    # Outputs the health board list in an actual visual list
-    for hb in healthBoards:
-        print('* ', hb)
-    sys.exit()
-else:
-    # Invalid argument selected, showing the user -h
-    parser.print_help()
+            dataPath = getLocalData(args.offline)
+        try:
+            if args.asOf is not None:
+                with phaseTimer('loadSnapshot'), lockDirectory('ExcelFiles', shared=True):
+                    cache = loadSnapshot(args.asOf)  # The data as it was published on the given date
+            elif args.revisions is None:
+                cache = loadData(dataPath, args.table)
+        except QueryError as error:
+            print(intro)
+            print(error)
+            sys.exit()
+
+    # CLI Input handler
+    # Uses argparse arguments to run a specific function
+    if args.serve is not None:
+        serveQueries(args.serve, dataPath, args.file is not None, args.offline, args.table)
+        return
+    elif args.batch is not None:
+        with phaseTimer('batch'):
+            runBatch(args.batch, args.format or 'json')
+        return
+    elif args.tables:
+        print(intro)
+        print('The following tables can be used with --table:')
+        for title in cache['tables']:
+            print('* ', title)
+        return
+    elif args.revisions is not None:
+        try:
+            with phaseTimer('revisions'), lockDirectory('ExcelFiles', shared=True):
+                changes = getRevisions(args.revisions[0], args.revisions[1])
+        except QueryError as error:
+            print(intro)
+            print(error)
+            sys.exit()
+        print(intro)
+        print('Case numbers changed between the data published on ' + args.revisions[0].isoformat() + ' and ' +
+              args.revisions[1].isoformat())
+        if len(changes) == 0:
+            print('No case numbers were changed')
+        for day, name, oldValue, newValue in changes:
+            print(day + ' | ' + name + ' | ' + str(oldValue) + ' -> ' + str(newValue))
+        return
+    try:
+        with phaseTimer('query'):
+            result = runQuery(args)
+        if args.export is not None:
+            with phaseTimer('export') as phase:
+                rows = exportData(args.export, args.format, result)
+                if args.export != '-':
+                    phase['bytes'] = os.path.getsize(args.export)
+    except QueryError as error:
+        print(intro)
+        print(error)
+        sys.exit()
+
+    if args.export is not None:
+        if args.export != '-':
+            print(intro)
+            print('Exported ' + str(rows) + ' rows to ' + args.export)
+    elif result is None:
+        # Invalid argument selected, showing the user -h
+        parser.print_help()
+    elif args.healthboards is True:
+        print(intro)
+        print(result[0])
+        # Outputs the health board list in an actual visual list
+        for hb in result[1]:
+            print('* ', hb)
+    else:
+        print(intro)
+        print(result[0])
+        outputData(result[1], result[2])
+
+
+if __name__ == '__main__':
+    main()
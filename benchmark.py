@@ -0,0 +1,350 @@
+#! python3
+# benchmark.py - Measures how long ScottishCovidCases.py takes to run, outputting the results as JSON
+# Synthetic Excel files, in the same layout as the Scottish Gov file, are made to time each step as the data grows
+# Everything runs offline, using the -f argument to give the program the synthetic files
+# Run with: python benchmark.py
+
+# Imports
+import argparse
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import ScottishCovidCases as scc
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScottishCovidCases.py')
+STARTUP_BUDGET = 100  # The most time, in milliseconds, -h and -hb may add on top of starting Python itself
+SIZES = [1000, 10000, 100000]  # The numbers of rows of data in the synthetic Excel files
+BOARDS = [15]  # The numbers of health board columns in the synthetic Excel files, including Scotland
+# The health board names used in the synthetic Excel files, extra columns are added before Scotland if needed
+BOARD_NAMES = ['NHS Ayrshire & Arran', 'NHS Borders', 'NHS Dumfries & Galloway', 'NHS Fife', 'NHS Forth Valley',
+               'NHS Grampian', 'NHS Greater Glasgow & Clyde', 'NHS Highland', 'NHS Lanarkshire', 'NHS Lothian',
+               'NHS Orkney', 'NHS Shetland', 'NHS Tayside', 'NHS Western Isles']
+# The command line queries timed on each synthetic Excel file
+QUERIES = [['-n'], ['-s'], ['-a', 'Highland'], ['-c', '7', 'all'], ['-c', '7', 'Highland'], ['-t'], ['-hb'],
+           ['-r', 'all'], ['-ra', '7', 'all']]
+
+
+# Functions
+def timeCommand(command, runs):
+    """
+    Runs a command several times, timing each run
+    :param command: (list): The command and its arguments
+    :param runs: (int): The number of times to run the command
+    :return: (list): The time each run took, in milliseconds
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def summarise(times):
+    """
+    Summarises a list of timings
+    :param times: (list): The time each run took, in milliseconds
+    :return: (dict): The fastest, median and slowest times, rounded to 0.01 ms
+    """
+    return {'min': round(min(times), 2), 'median': round(statistics.median(times), 2), 'max': round(max(times), 2)}
+
+
+def getImportTimes(command):
+    """
+    Uses Python's -X importtime option to measure how long a command spends importing each top level module
+    :param command: (list): The arguments to run Python with
+    :return: (dict): The time spent importing each top level module and the modules it imports, in milliseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # Each line is 'import time: self | cumulative | name', top level imports have no indentation on the name
+        parts = line.split('|')
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith('  '):
+            times[parts[2].strip()] = int(parts[1]) / 1000
+    return times
+
+
+def timePhase(function, runs):
+    """
+    Runs a function several times, timing each run
+    :param function: (function): The function to time, which takes no arguments
+    :param runs: (int): The number of times to run the function
+    :return: (float): The median time the function took, in milliseconds, rounded to 0.001 ms
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return round(statistics.median(times), 3)
+
+
+def makeWorkbook(path, rows, boards, seed=None):
+    """
+    Makes an Excel file in the same layout as the Scottish Gov file, with made up case numbers
+    The cumulative cases are on the third sheet, with the health board names on row 3 from column 2, the dates in
+    column 1 and '*' in place of numbers less than 5
+    :param path: (str): The path to save the Excel file to
+    :param rows: (int): The number of rows of data
+    :param boards: (int): The number of health board columns, including Scotland
+    :param seed: (int): The seed for the made up case numbers, files with the same seed have the same rows in common
+                        (default: based on the number of rows and health boards)
+    """
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+
+    names = (BOARD_NAMES + ['NHS Extra Board ' + str(num) for num in range(boards)])[:boards - 1] + ['Scotland']
+    excel = Workbook(write_only=True)  # Write only mode streams the rows to the file, so large files can be made
+    excel.create_sheet('Contents').append(['Synthetic data made by benchmark.py'])
+    excel.create_sheet('Notes').append(['Synthetic data made by benchmark.py'])
+    sheet = excel.create_sheet('Table 1 - Cumulative cases')
+    sheet.append(['Table 1 - Cumulative cases'])
+    sheet.append([])
+    sheet.append(['Date'] + names)
+
+    random.seed(rows * boards if seed is None else seed)  # The same sizes always make the same data
+    totals = [0] * (boards - 1)
+    start = datetime(2020, 3, 1)
+    for rowNum in range(rows):
+        for col in range(boards - 1):
+            totals[col] += random.randint(0, 3 + rowNum % 50)
+        values = [total if total >= 5 else '*' for total in totals]
+        sheet.append([start + timedelta(days=rowNum)] + values + [sum(totals)])
+    excel.save(path)
+    addDimensions(path, ['A1:A1', 'A1:A1', 'A1:' + get_column_letter(boards + 1) + str(rows + 3)])
+
+
+def addDimensions(path, dimensions):
+    """
+    Adds the size of each sheet to an Excel file, as Excel does but openpyxl's write only mode does not
+    Without it, openpyxl's read only mode reads the whole of each sheet when it opens the file, to find its size
+    :param path: (str): The path of the Excel file
+    :param dimensions: (list): The range of cells used in each sheet, e.g. A1:P300, in the same order as the sheets
+    """
+    import zipfile
+
+    with zipfile.ZipFile(path) as excel:
+        parts = [(info, excel.read(info.filename)) for info in excel.infolist()]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as excel:
+        for info, content in parts:
+            match = re.fullmatch(r'xl/worksheets/sheet(\d+)\.xml', info.filename)
+            if match is not None:
+                dimension = b'<dimension ref="' + dimensions[int(match.group(1)) - 1].encode() + b'" />'
+                content = content.replace(b'</sheetPr>', b'</sheetPr>' + dimension, 1)
+            excel.writestr(info, content, zipfile.ZIP_DEFLATED)
+
+
+def legacyLoad(path):
+    """
+    Loads the Excel file the way the program did before the binary cache, with the whole file in memory
+    :param path: (str): The path of the Excel file
+    :return: (openpyxl.worksheet.worksheet.Worksheet): The cumulative cases sheet
+    """
+    from openpyxl import load_workbook
+
+    return load_workbook(path, data_only=True).worksheets[2]
+
+
+def legacyLastRow(sheet):
+    """
+    Finds the last row of data the way the program did before the binary cache, looping back from sheet.max_row
+    :param sheet: (openpyxl.worksheet.worksheet.Worksheet): The cumulative cases sheet
+    :return: (int): The row number of the last row of data
+    """
+    lastRow = sheet.max_row
+    while sheet.cell(row=lastRow, column=1).value is None:
+        lastRow -= 1
+    return lastRow
+
+
+def legacyPeriodAll(sheet, lastRow, length):
+    """
+    Gets every health board's cases over a period the way the program did before the binary cache, cell by cell
+    :param sheet: (openpyxl.worksheet.worksheet.Worksheet): The cumulative cases sheet
+    :param lastRow: (int): The row number of the last row of data
+    :param length: (int): The number of days
+    :return: (list): The cases for each health board
+    """
+    values = []
+    for col in range(2, sheet.max_column + 1):
+        newCell = sheet.cell(row=lastRow, column=col).value
+        olderCell = sheet.cell(row=lastRow - length, column=col).value
+        if type(newCell) is not int:
+            newCell = int(re.sub("[^0-9]", "", newCell))
+        if type(olderCell) is not int:
+            olderCell = int(re.sub("[^0-9]", "", olderCell))
+        values.append(newCell - olderCell)
+    return values
+
+
+def legacyFullName(sheet, location):
+    """
+    Finds a health board's full name the way the program did before the binary cache, reading row 3 for every lookup
+    :param sheet: (openpyxl.worksheet.worksheet.Worksheet): The cumulative cases sheet
+    :param location: (str): The health board name to find, e.g. Highland
+    :return: (str): The full name of the health board
+    """
+    names = [cell.value for row in sheet.iter_rows(min_row=3, min_col=2, max_row=3) for cell in row]
+    for name in names:
+        if location.lower() in [part.lower() for part in name.split()]:
+            return name
+
+
+def benchmarkPhases(path, rows, boards, runs):
+    """
+    Times each step of loading and querying a synthetic Excel file, within this process
+    :param path: (str): The path of the synthetic Excel file
+    :param rows: (int): The number of rows of data in the file
+    :param boards: (int): The number of health board columns in the file
+    :param runs: (int): The number of times to run the quicker steps
+    :return: (dict): The median time of each step, in milliseconds
+    """
+    phases = {}
+    # The steps the program took before the binary cache, only timed once as they are slow for large files
+    start = time.perf_counter()
+    sheet = legacyLoad(path)
+    phases['legacyLoadWorkbook'] = round((time.perf_counter() - start) * 1000, 2)
+    lastRow = legacyLastRow(sheet)
+    phases['legacyLastRowScan'] = timePhase(lambda: legacyLastRow(sheet), runs)
+    phases['legacyPeriodAll'] = timePhase(lambda: legacyPeriodAll(sheet, lastRow, 7), runs)
+    phases['legacyFullName'] = timePhase(lambda: legacyFullName(sheet, 'Highland'), runs)
+    del sheet
+
+    # The steps the program takes now
+    start = time.perf_counter()
+    scc.readCumulativeCases(path)
+    phases['readCumulativeCases'] = round((time.perf_counter() - start) * 1000, 2)
+    start = time.perf_counter()
+    scc.buildCache(path)
+    phases['buildCache'] = round((time.perf_counter() - start) * 1000, 2)
+    # The next day's file has one more row, so only that row is read and the rest come from the cache just built
+    nextPath = path.replace('.xlsx', '-nextday.xlsx')
+    makeWorkbook(nextPath, rows + 1, boards, seed=rows * boards)
+    start = time.perf_counter()
+    scc.buildCache(nextPath)
+    phases['buildCacheNextDay'] = round((time.perf_counter() - start) * 1000, 2)
+    phases['loadCache'] = timePhase(lambda: scc.loadCache(path), runs)
+    phases['prepareData'] = timePhase(lambda: scc.prepareData(scc.loadCache(path)), runs)
+    scc.cache = scc.loadData(path)
+    phases['getHealthBoardPeriodAll'] = timePhase(lambda: scc.getHealthBoardPeriod(7, 'all'), runs)
+    phases['getHealthBoardRangeAll'] = timePhase(lambda: scc.getHealthBoardRange(None, None, 'all'), runs)
+    phases['getHealthBoardAverageAll'] = timePhase(lambda: scc.getHealthBoardAverage(7, None, 'all'), runs)
+    phases['buildNameIndex'] = timePhase(lambda: scc.buildNameIndex(scc.cache['names']), runs)
+    phases['getHealthBoardFullName'] = timePhase(lambda: scc.getHealthBoardFullName('Highland'), runs)
+    phases['handleInput'] = timePhase(lambda: scc.handleInput(['Greater', 'Glasgow']), runs)
+    return phases
+
+
+def benchmarkQueries(path, runs):
+    """
+    Times each command line query on a synthetic Excel file, from starting Python to the program ending
+    :param path: (str): The path of the synthetic Excel file
+    :param runs: (int): The number of times to run each query
+    :return: (dict): The timings for each query, in milliseconds, and the time of the first query which builds the cache
+    """
+    if os.path.exists(scc.getCachePath(path)):
+        os.remove(scc.getCachePath(path))
+    results = {'firstRun': summarise(timeCommand([sys.executable, SCRIPT, '-s', '-f', path], 1))}
+    for query in QUERIES:
+        results[' '.join(query)] = summarise(timeCommand([sys.executable, SCRIPT] + query + ['-f', path], runs))
+    return results
+
+
+def benchmarkWorkbooks(sizes, boards, runs, directory):
+    """
+    Makes synthetic Excel files of each size, timing each step and each command line query
+    :param sizes: (list): The numbers of rows of data
+    :param boards: (list): The numbers of health board columns
+    :param runs: (int): The number of times to run each query
+    :param directory: (str): The directory to save the synthetic Excel files in
+    :return: (list): The results for each synthetic Excel file
+    """
+    results = []
+    for boardNum in boards:
+        for rows in sizes:
+            path = os.path.join(directory, 'COVID-19-' + str(rows) + 'rows-' + str(boardNum) + 'boards.xlsx')
+            start = time.perf_counter()
+            makeWorkbook(path, rows, boardNum)
+            results.append({'rows': rows, 'boards': boardNum, 'fileSize': os.path.getsize(path),
+                            'makeWorkbook': round((time.perf_counter() - start) * 1000, 2),
+                            'phases': benchmarkPhases(path, rows, boardNum, runs), 'queries': benchmarkQueries(path, runs)})
+            print('Benchmarked ' + str(rows) + ' rows, ' + str(boardNum) + ' boards', file=sys.stderr)
+    return results
+
+
+def benchmarkStartup(runs):
+    """
+    Times how long -h and -hb take, compared to starting Python and doing nothing
+    :param runs: (int): The number of times to run each command
+    :return: (dict): The timings for each command, with the time added on top of starting Python ('overhead') and
+                     the time spent importing the script's modules ('imports'), in milliseconds
+    """
+    baseline = summarise(timeCommand([sys.executable, '-c', 'pass'], runs))
+    startupImports = getImportTimes(['-c', 'pass'])  # Modules Python imports when it starts
+    results = {'python': baseline}
+    for arguments in (['-h'], ['-hb']):
+        timings = summarise(timeCommand([sys.executable, SCRIPT] + arguments, runs))
+        timings['overhead'] = round(timings['median'] - baseline['median'], 2)
+        imports = getImportTimes([SCRIPT] + arguments)
+        timings['imports'] = round(sum(imports[name] for name in imports if name not in startupImports), 2)
+        results[' '.join(arguments)] = timings
+    return results
+
+
+def main():
+    """
+    Runs the benchmarks and outputs the results as JSON
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks ScottishCovidCases.py, outputting the results as JSON')
+    parser.add_argument('-r', '--runs', type=int, default=20, help="The number of times to run each command")
+    parser.add_argument('-o', '--output', help="Saves the results to the given file, as well as printing them",
+                        metavar='FILE')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="The numbers of rows of data in the "
+                                                                            "synthetic Excel files (default: 1000 "
+                                                                            "10000 100000)")
+    parser.add_argument('--boards', type=int, nargs='+', default=BOARDS, help="The numbers of health board columns in "
+                                                                              "the synthetic Excel files, including "
+                                                                              "Scotland (default: 15)")
+    parser.add_argument('--startup', action='store_true', help="Only times -h and -hb, without making any synthetic "
+                                                               "Excel files")
+    parser.add_argument('--keep', help="Saves the synthetic Excel files in the given directory, instead of deleting "
+                                       "them", metavar='DIR')
+    args = parser.parse_args()
+    if min(args.boards) < 2:
+        parser.error('--boards must be at least 2, a health board and Scotland')
+
+    results = {'python': sys.version.split()[0], 'startup': benchmarkStartup(args.runs)}
+    if not args.startup:
+        directory = args.keep if args.keep is not None else tempfile.mkdtemp()
+        os.makedirs(directory, exist_ok=True)
+        try:
+            results['workbooks'] = benchmarkWorkbooks(args.sizes, args.boards, args.runs, directory)
+        finally:
+            if args.keep is None:
+                shutil.rmtree(directory)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output is not None:
+        with open(args.output, 'w') as outputFile:
+            outputFile.write(output + '\n')
+
+    # Fails if -h or -hb take too long to start, not counting the time Python takes to start
+    slow = [name for name in ('-h', '-hb') if results['startup'][name]['overhead'] > STARTUP_BUDGET]
+    if slow:
+        print('Startup is over the ' + str(STARTUP_BUDGET) + ' ms budget for: ' + ', '.join(slow), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+#! python3
+# test_ScottishCovidCases.py - Tests the downloads and the incremental reading of Excel files in ScottishCovidCases.py
+# The Excel files are made up by benchmark.py and served from a local web server, so everything runs offline
+# Run with: python -m unittest test_ScottishCovidCases
+
+# Imports
+import asyncio
+import hashlib
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import ScottishCovidCases as scc
+from benchmark import makeWorkbook
+
+ROWS = 200  # The number of rows of data in the first made up Excel file
+BOARDS = 15  # The number of health board columns in the made up Excel files, including Scotland
+TABLE = 'Table 1 - Cumulative cases'  # The title of the sheet made by makeWorkbook()
+
+
+# Classes
+class ExcelFileHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the server's current file, with its ETag, and the part of it asked for with Range if it has not changed
+    since the ETag given with If-Range
+    """
+    protocol_version = 'HTTP/1.1'  # Needed for the Content-Length to be checked, so a cut short response is noticed
+
+    def log_message(self, *args):
+        pass  # Keeps the test output clean
+
+    def do_GET(self):
+        server = self.server
+        body = server.body
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        byteRange = self.headers.get('Range')
+        server.requests.append((byteRange, self.headers.get('If-Range')))
+        if byteRange is not None and server.checkIfRange and self.headers.get('If-Range') != etag:
+            byteRange = None  # The file has changed, so the whole of the new file is sent
+        start = int(byteRange.partition('=')[2].rstrip('-')) if byteRange is not None else 0
+        if byteRange is not None:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(len(body) - 1) + '/' + str(len(body)))
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        if server.cutAfter is not None:
+            # Sends only the start of the file then drops the connection, as a failing network would
+            self.wfile.write(body[start:start + server.cutAfter])
+            server.cutAfter = None
+            self.close_connection = True
+            return
+        self.wfile.write(body[start:])
+
+
+class DownloadTests(unittest.TestCase):
+    """
+    Tests that fetchFile() and fetchFileWithRetries() carry on an interrupted download, and start again if the file
+    changed in between
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.files = []
+        for rows in (ROWS, ROWS + 1):
+            path = os.path.join(cls.directory, 'source' + str(rows) + '.xlsx')
+            makeWorkbook(path, rows, BOARDS, seed=1)
+            with open(path, 'rb') as excelFile:
+                cls.files.append(excelFile.read())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ExcelFileHandler)
+        self.server.body = self.files[0]
+        self.server.cutAfter = None
+        self.server.checkIfRange = True
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/data.xlsx'
+        self.path = os.path.join(self.directory, 'download.xlsx')
+        # Stops the retries from waiting and keeps their messages out of the test output
+        patches = [mock.patch.object(scc, 'DOWNLOAD_BACKOFF', 0), mock.patch.object(scc, 'statusOutput', io.StringIO())]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for oldPath in (self.path, self.path + scc.PARTIAL_EXT, self.path + scc.PARTIAL_EXT + scc.PARTIAL_DETAILS_EXT):
+            if os.path.exists(oldPath):
+                os.remove(oldPath)
+
+    def interrupt(self):
+        """
+        Starts a download that is cut off half way through the file, leaving a partial download behind
+        :return: (int): The number of bytes in the partial download
+        """
+        self.server.cutAfter = len(self.server.body) // 2
+        with self.assertRaises(Exception):
+            scc.fetchFile(self.url, self.path)
+        self.assertFalse(os.path.exists(self.path))
+        return os.path.getsize(self.path + scc.PARTIAL_EXT)
+
+    def assertDownloaded(self, body):
+        """
+        Checks the downloaded file is the given file and nothing of the partial download is left
+        :param body: (bytes): The file that should have been downloaded
+        """
+        with open(self.path, 'rb') as excelFile:
+            self.assertEqual(excelFile.read(), body)
+        self.assertFalse(os.path.exists(self.path + scc.PARTIAL_EXT))
+        self.assertFalse(os.path.exists(self.path + scc.PARTIAL_EXT + scc.PARTIAL_DETAILS_EXT))
+
+    def testResume(self):
+        offset = self.interrupt()
+        self.assertGreater(offset, 0)
+        result = scc.fetchFile(self.url, self.path, len(self.files[0]), hashlib.sha256(self.files[0]).hexdigest())
+        # Only the rest of the file is asked for and downloaded
+        self.assertEqual(self.server.requests[-1][0], 'bytes=' + str(offset) + '-')
+        self.assertEqual(result['bytes'], len(self.files[0]) - offset)
+        self.assertEqual(result['sha256'], hashlib.sha256(self.files[0]).hexdigest())
+        self.assertDownloaded(self.files[0])
+
+    def testResumeWithRetries(self):
+        self.server.cutAfter = len(self.files[0]) // 2
+        result = asyncio.run(scc.fetchFileWithRetries(self.url, self.path))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(result['bytes'], len(self.files[0]) - len(self.files[0]) // 2)
+        self.assertDownloaded(self.files[0])
+
+    def testChangedETag(self):
+        self.interrupt()
+        self.server.body = self.files[1]  # The file on the website is replaced by the next day's
+        result = scc.fetchFile(self.url, self.path)
+        # The old ETag is sent back, so the website sends the whole of the new file rather than the rest of it
+        self.assertIsNotNone(self.server.requests[-1][1])
+        self.assertEqual(result['bytes'], len(self.files[1]))
+        self.assertDownloaded(self.files[1])
+
+    def testChangedETagIgnored(self):
+        self.interrupt()
+        self.server.body = self.files[1]
+        self.server.checkIfRange = False  # A website that sends the rest of the new file anyway
+        with self.assertRaises(scc.DownloadError):
+            scc.fetchFile(self.url, self.path)
+        self.assertFalse(os.path.exists(self.path + scc.PARTIAL_EXT))
+        # The retry starts again from the beginning, so the two versions are never joined together
+        asyncio.run(scc.fetchFileWithRetries(self.url, self.path))
+        self.assertIsNone(self.server.requests[-1][0])
+        self.assertDownloaded(self.files[1])
+
+
+class IncrementalReadTests(unittest.TestCase):
+    """
+    Tests that reading only the rows added to an Excel file since the last cache gives the same table as reading the
+    whole file
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def readBoth(self, firstSeed, secondSeed):
+        """
+        Caches a file, then reads the next day's file using that cache and in full
+        :param firstSeed: (int): The seed for the case numbers in the first file
+        :param secondSeed: (int): The seed for the case numbers in the next day's file, which has one more row
+        :return: (tuple): The table read using the cache, the table read in full and the number of times the sheet
+                          was read in full while using the cache
+        """
+        firstPath = os.path.join(self.directory, 'first.xlsx')
+        secondPath = os.path.join(self.directory, 'second.xlsx')
+        makeWorkbook(firstPath, ROWS, BOARDS, seed=firstSeed)
+        makeWorkbook(secondPath, ROWS + 1, BOARDS, seed=secondSeed)
+        scc.buildCache(firstPath)
+        base = scc.findBaseCache(secondPath)
+        baseTable = [details for details in base['tables'] if details['title'] == TABLE][0]
+        baseTable = {'path': base['path'], 'headerLength': base['headerLength'], 'details': baseTable}
+        with mock.patch.object(scc, 'readSheet', wraps=scc.readSheet) as readSheet:
+            incremental = scc.readTable(secondPath, TABLE, baseTable)
+        return incremental, scc.readTable(secondPath, TABLE), readSheet.call_count
+
+    def assertSameTable(self, incremental, full):
+        """
+        Checks two tables hold the same data
+        :param incremental: (dict): The table read using the cache of an earlier file
+        :param full: (dict): The table read in full
+        """
+        for key in ('title', 'names', 'firstRow', 'ingest'):
+            self.assertEqual(incremental[key], full[key], key)
+        np.testing.assert_array_equal(incremental['dates'], full['dates'])
+        np.testing.assert_array_equal(incremental['cases'], full['cases'])
+
+    def testNewRow(self):
+        incremental, full, fullReads = self.readBoth(1, 1)
+        self.assertEqual(fullReads, 0)  # Only the new row was read
+        self.assertEqual(len(full['dates']), ROWS + 1)
+        self.assertSameTable(incremental, full)
+
+    def testRevisedRows(self):
+        # Different case numbers in the rows the files have in common, so the earlier cache can not be used
+        incremental, full, fullReads = self.readBoth(1, 2)
+        self.assertEqual(fullReads, 1)
+        self.assertSameTable(incremental, full)
+
+    def testBuildCache(self):
+        firstPath = os.path.join(self.directory, 'first.xlsx')
+        secondPath = os.path.join(self.directory, 'second.xlsx')
+        makeWorkbook(firstPath, ROWS, BOARDS, seed=1)
+        makeWorkbook(secondPath, ROWS + 1, BOARDS, seed=1)
+        scc.buildCache(firstPath)
+        incremental = scc.buildCache(secondPath)
+        fullPath = os.path.join(self.directory, 'full')
+        os.mkdir(fullPath)
+        full = scc.buildCache(shutil.copy2(secondPath, fullPath))
+        for key in ('title', 'tables', 'names', 'firstRow', 'source'):
+            self.assertEqual(incremental[key], full[key], key)
+        np.testing.assert_array_equal(incremental['dates'], full['dates'])
+        np.testing.assert_array_equal(incremental['cases'], full['cases'])
+
+
+if __name__ == '__main__':
+    unittest.main()